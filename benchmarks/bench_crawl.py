@@ -0,0 +1,42 @@
+"""Compares the serial crawl loop with the concurrent crawl pipeline against local stand-in hosts.
+
+Usage: python -m benchmarks.bench_crawl [--urls 60] [--hosts 6] [--latency 0.3] [--embed-latency 0.05]
+"""
+import argparse
+import time
+
+import requests
+import trafilatura
+
+import main
+from benchmarks.common import PageHandler, base_url, serve
+
+def serial_crawl(sources, embed_latency):
+    for source in sources:
+        response = requests.get(source['url'], timeout=15)
+        response.raise_for_status()
+        trafilatura.extract(response.text)
+        time.sleep(embed_latency)
+
+def pipelined_crawl(sources, embed_latency):
+    for _ in main.crawl_sources(sources):
+        time.sleep(embed_latency)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", type=int, default=60)
+    parser.add_argument("--hosts", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.3, help="Simulated server latency per page in seconds.")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Simulated chunk+embed time per page in seconds.")
+    args = parser.parse_args()
+
+    servers = [serve(PageHandler, args.latency) for _ in range(args.hosts)]
+    sources = [{"url": f"{base_url(servers[i % args.hosts])}/page-{i}"} for i in range(args.urls)]
+
+    results = {}
+    for name, crawl in (("serial", serial_crawl), ("pipelined", pipelined_crawl)):
+        start = time.perf_counter()
+        crawl(sources, args.embed_latency)
+        results[name] = time.perf_counter() - start
+        print(f"{name:>10}: {results[name]:.2f}s for {args.urls} URLs")
+    print(f"   speedup: {results['serial'] / results['pipelined']:.1f}x")
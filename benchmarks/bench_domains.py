@@ -0,0 +1,49 @@
+"""Compares the old substring scan over authority tiers with the precompiled domain index on a large authority list.
+
+Usage: python -m benchmarks.bench_domains [--domains 5000] [--urls 20000]
+"""
+import argparse
+import random
+import time
+from functools import lru_cache
+from urllib.parse import urlparse
+
+import main
+
+def substring_score(url, tiers):
+    domain = urlparse(url).netloc
+    for score, keywords in tiers.items():
+        if any(keyword in domain for keyword in keywords):
+            return float(score)
+    return 0.3
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--domains", type=int, default=5000, help="Authority list size.")
+    parser.add_argument("--urls", type=int, default=20000, help="Lookups, drawn from a pool of a quarter as many distinct URLs.")
+    args = parser.parse_args()
+
+    random.seed(0)
+    tiers = {score: [] for score in ("1.0", "0.9", "0.8", "0.7", "0.6", "0.5")}
+    for i in range(args.domains):
+        rule = f"site{i}.example.com" if i % 10 else f"site{i}.example.com/blog"
+        tiers[random.choice(list(tiers))].append(rule)
+    pool = [f"https://{'docs.' if i % 3 == 0 else ''}site{random.randrange(args.domains * 2)}.example.com/blog/post-{i}" for i in range(args.urls // 4)]
+    urls = [random.choice(pool) for _ in range(args.urls)]
+
+    start = time.perf_counter()
+    for url in urls:
+        substring_score(url, tiers)
+    scan = time.perf_counter() - start
+    print(f"substring scan: {scan:.3f}s ({scan / args.urls * 1e6:.1f} us/lookup)")
+
+    start = time.perf_counter()
+    index = main.DomainAuthorityIndex(tiers, 0.3)
+    build = time.perf_counter() - start
+    score = lru_cache(maxsize=65536)(index.score)
+    start = time.perf_counter()
+    for url in urls:
+        score(url)
+    indexed = time.perf_counter() - start
+    print(f"  domain index: {indexed:.3f}s ({indexed / args.urls * 1e6:.1f} us/lookup, built in {build * 1000:.1f} ms)")
+    print(f"       speedup: {scan / indexed:.0f}x")
@@ -0,0 +1,192 @@
+"""Runs every graph node and the full app offline against recorded fixtures and fake LLM/embedding backends.
+
+Each scale runs in fresh subprocesses with cold caches: one times every node in workflow order and traces
+the peak Python allocations it adds, the other runs the full graph end to end. Results can be written as a baseline
+and later compared against it to flag regressions.
+
+Usage: python -m benchmarks.bench_pipeline [--sources 10 100 1000] [--llm-latency 0.05] [--embed-latency 0.02]
+                                           [--page-latency 0.05] [--write-baseline PATH | --compare PATH]
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+TECHNOLOGIES = ["FastAPI", "Flask"]
+# main imports these inside the nodes that use them; loading them up front keeps import cost out of node timings.
+LAZY_MODULES = ["chromadb", "langchain.text_splitter", "langchain_core.output_parsers", "langgraph.graph", "numpy", "requests", "tiktoken", "trafilatura"]
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, "benchmarks", "baseline.json")
+
+def setup_offline(args) -> None:
+    """Points main at local fixture servers and fake backends. Must run before main builds any service."""
+    import langchain_google_genai
+    import main
+    from benchmarks.common import FakeChatModel, FakeEmbeddings, FixtureBraveHandler, FixturePageHandler, base_url, serve
+
+    FakeChatModel.latency = args.llm_latency
+    FakeEmbeddings.latency = args.embed_latency
+    langchain_google_genai.ChatGoogleGenerativeAI = FakeChatModel
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = FakeEmbeddings
+
+    page_servers = [serve(FixturePageHandler, args.page_latency) for _ in range(args.hosts)]
+    queries = len([s for s in FakeChatModel.stages if s.lower() not in main.NON_RESEARCH_STAGES])
+    if os.getenv("PLANNING_MODE", "single_call") == "single_call":
+        queries *= int(os.getenv("PLANNING_QUERIES_PER_STAGE", "2"))
+    FixtureBraveHandler.page_base_urls = [base_url(server) for server in page_servers]
+    FixtureBraveHandler.results_per_query = math.ceil(args.worker_sources / queries)
+    brave = serve(FixtureBraveHandler, args.search_latency)
+    os.environ["BRAVE_API_URL"] = f"{base_url(brave)}/res/v1/web/search"
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    main.get_tokenizer()
+
+def run_nodes(args) -> dict:
+    import main
+    state = {"technologies": TECHNOLOGIES}
+    results = {}
+    tracemalloc.start()
+    for name in main.build_workflow().nodes:
+        tracemalloc.reset_peak()
+        baseline_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        state = getattr(main, name)(state)
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "sources_per_second": round(args.worker_sources / seconds, 1) if seconds else None,
+            "peak_traced_mb": round((tracemalloc.get_traced_memory()[1] - baseline_bytes) / 1e6, 2),
+        }
+    tracemalloc.stop()
+    results["_counts"] = {
+        "raw_sources": len(state.get("raw_sources", [])),
+        "crawled_urls": len(state.get("crawled_urls", [])),
+        "report_chars": len(state.get("final_report") or ""),
+    }
+    return results
+
+def run_app(args) -> dict:
+    import main
+    first_output = {}
+
+    def record_first_output(section: str, text: str, done: bool = False) -> None:
+        first_output.setdefault("token", time.perf_counter() - start)
+        if done:
+            first_output.setdefault("section", time.perf_counter() - start)
+
+    main._token_sink.set(record_first_output)
+    start = time.perf_counter()
+    state = main.get_app().invoke({"technologies": TECHNOLOGIES})
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 4),
+        "first_token_seconds": round(first_output.get("token", seconds), 4),
+        "first_section_seconds": round(first_output.get("section", seconds), 4),
+        "sources_per_second": round(args.worker_sources / seconds, 1),
+        "peak_rss_mb": round(main.peak_rss_mb() or 0, 1),
+        "report_chars": len(state.get("final_report") or ""),
+    }
+
+def run_worker(args) -> None:
+    setup_offline(args)
+    result = run_nodes(args) if args.worker == "nodes" else run_app(args)
+    print(json.dumps(result))
+
+def run_scale(sources: int, args) -> dict:
+    scale = {}
+    for mode in ("nodes", "app"):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(os.environ,
+                       CACHE_DIR=os.path.join(workdir, "cache"),
+                       CHROMA_DB_PATH=os.path.join(workdir, "chroma_db"),
+                       CHECKPOINT_DB_PATH=os.path.join(workdir, "checkpoints.sqlite"),
+                       PROFILE_DIR=os.path.join(workdir, "profiles"),
+                       PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get("PYTHONPATH")])),
+                       BRAVE_API_KEY="fixture", BRAVE_QPS="1000",
+                       GEMINI_FLASH_MODEL="fake-flash", GEMINI_PRO_MODEL="fake-pro",
+                       LLM_FLASH_RPM="1000000", LLM_PRO_RPM="1000000", LLM_FLASH_TPM="1000000000", LLM_PRO_TPM="1000000000")
+            command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--worker", mode, "--worker-sources", str(sources),
+                       "--llm-latency", str(args.llm_latency), "--embed-latency", str(args.embed_latency),
+                       "--page-latency", str(args.page_latency), "--search-latency", str(args.search_latency), "--hosts", str(args.hosts)]
+            completed = subprocess.run(command, env=env, cwd=workdir, capture_output=True, text=True)
+            if completed.returncode != 0:
+                raise RuntimeError(f"{mode} run at {sources} sources failed:\n{completed.stderr[-2000:]}")
+            scale[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+    return scale
+
+def print_scale(sources: int, scale: dict) -> None:
+    counts = scale["nodes"].pop("_counts")
+    print(f"\n{sources} sources ({counts['raw_sources']} after dedup, {counts['crawled_urls']} crawled, {counts['report_chars']} report chars)")
+    print(f"  {'node':<28} {'seconds':>8} {'sources/s':>10} {'peak MB':>8}")
+    for name, metrics in scale["nodes"].items():
+        print(f"  {name:<28} {metrics['seconds']:>8.3f} {metrics['sources_per_second'] or 0:>10.1f} {metrics['peak_traced_mb']:>8.2f}")
+    app = scale["app"]
+    print(f"  {'full app':<28} {app['seconds']:>8.3f} {app['sources_per_second']:>10.1f} {app['peak_rss_mb']:>7.1f}R")
+    print(f"  first streamed token after {app['first_token_seconds']:.3f}s, first finished section after {app['first_section_seconds']:.3f}s")
+    scale["nodes"]["_counts"] = counts
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float) -> list:
+    """Returns a message for every metric that is more than `tolerance` worse than the baseline."""
+    regressions = []
+    for sources, scale in results.items():
+        base_scale = baseline.get("results", {}).get(sources)
+        if not base_scale:
+            continue
+        checks = [(f"{name}.seconds", m["seconds"], base_scale["nodes"].get(name, {}).get("seconds"), min_seconds)
+                  for name, m in scale["nodes"].items() if not name.startswith("_")]
+        checks += [(f"{name}.peak_traced_mb", m["peak_traced_mb"], base_scale["nodes"].get(name, {}).get("peak_traced_mb"), 1.0)
+                   for name, m in scale["nodes"].items() if not name.startswith("_")]
+        checks += [(f"app.{metric}", scale["app"][metric], base_scale["app"].get(metric), min_seconds)
+                   for metric in ("seconds", "first_token_seconds", "first_section_seconds")]
+        checks.append(("app.peak_rss_mb", scale["app"]["peak_rss_mb"], base_scale["app"]["peak_rss_mb"], 10.0))
+        for metric, value, base, floor in checks:
+            if base is not None and value > base * (1 + tolerance) and value - base > floor:
+                regressions.append(f"{sources} sources: {metric} {base} -> {value} (+{(value / base - 1) * 100 if base else float('inf'):.0f}%)")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sources", type=int, nargs="+", default=[10, 100, 1000], help="Search result counts to benchmark.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM latency per call in seconds.")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Fake embedding latency per batch in seconds.")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Fixture page server latency in seconds.")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Fixture Brave server latency in seconds.")
+    parser.add_argument("--hosts", type=int, default=6, help="Number of local page hosts.")
+    parser.add_argument("--write-baseline", metavar="PATH", nargs="?", const=DEFAULT_BASELINE, help="Write results as the regression baseline.")
+    parser.add_argument("--compare", metavar="PATH", nargs="?", const=DEFAULT_BASELINE, help="Exit non-zero if results regress against a baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed relative slowdown or memory growth before a metric counts as a regression.")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="Ignore slowdowns smaller than this many seconds.")
+    parser.add_argument("--worker", choices=["nodes", "app"], help=argparse.SUPPRESS)
+    parser.add_argument("--worker-sources", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        sys.exit(0)
+
+    results = {}
+    for sources in args.sources:
+        results[str(sources)] = run_scale(sources, args)
+        print_scale(sources, results[str(sources)])
+
+    settings = {key: getattr(args, key) for key in ("llm_latency", "embed_latency", "page_latency", "search_latency", "hosts")}
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.write_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print(f"\nWarning: baseline was recorded with different settings: {baseline.get('settings')}")
+        regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"\n{len(regressions)} regressions against {args.compare}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,55 @@
+"""Compares one-at-a-time rendering with a fixed 3 second sleep against the shared BrowserPool.
+
+Requires a Chromium that pyppeteer can launch.
+Usage: python -m benchmarks.bench_render [--pages 12]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+
+import pyppeteer
+import trafilatura
+
+from benchmarks.common import ScriptPageHandler, base_url, serve
+
+async def serial_render(urls):
+    browser = await pyppeteer.launch(headless=True, args=["--no-sandbox"])
+    extracted = 0
+    for url in urls:
+        page = await browser.newPage()
+        await page.goto(url, timeout=25000)
+        await asyncio.sleep(3)
+        extracted += bool(trafilatura.extract(await page.content()))
+        await page.close()
+    await browser.close()
+    return extracted
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=12)
+    args = parser.parse_args()
+    os.environ["CACHE_DIR"] = tempfile.mkdtemp()
+    import main
+
+    server = serve(ScriptPageHandler)
+    urls = [f"{base_url(server)}/spa-{i}" for i in range(args.pages)]
+
+    start = time.perf_counter()
+    extracted = asyncio.run(serial_render(urls))
+    serial = time.perf_counter() - start
+    print(f"  serial: {serial:.2f}s, {extracted}/{args.pages} pages extracted")
+
+    stats = Counter()
+    start = time.perf_counter()
+    extracted = sum(bool(text) for _, text in main.crawl_sources([{"url": url} for url in urls], stats))
+    pooled = time.perf_counter() - start
+    print(f"  pooled: {pooled:.2f}s, {extracted}/{args.pages} pages extracted, {dict(stats)}")
+    print(f" speedup: {serial / pooled:.1f}x")
+
+    os.environ["PAGE_CACHE_TTL_SECONDS"] = "0"
+    start = time.perf_counter()
+    list(main.crawl_sources([{"url": f"{url}?again"} for url in urls]))
+    print(f"  repeat: {time.perf_counter() - start:.2f}s with the host remembered as JS-only")
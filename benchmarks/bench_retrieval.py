@@ -0,0 +1,98 @@
+"""Compares per-section Chroma retrieval with the in-process hybrid RetrievalIndex on a synthetic report corpus.
+
+The Chroma path embeds each section query separately, then runs a filtered `query` and a `get` for the stage's sources
+per section. The index path loads the chunks once, embeds all section queries in one batch and answers them with one
+matrix multiply. Recall is measured against exact cosine top-k, and every query also names a planted term (a version
+number) found in a few chunks whose embeddings are far from the query, which only lexical matching can find.
+
+Usage: python -m benchmarks.bench_retrieval [--chunks 3000] [--sources 60] [--sections 8] [--dim 768] [--embed-latency 0.1]
+"""
+import argparse
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+import main
+
+def build_corpus(args, rng):
+    centers = rng.normal(size=(args.sources, args.dim)).astype(np.float32)
+    source_of = rng.integers(0, args.sources, size=args.chunks)
+    embeddings = centers[source_of] + 0.8 * rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+    vocabulary = [f"word{i}" for i in range(2000)]
+    documents = [" ".join(rng.choice(vocabulary, size=120)) for _ in range(args.chunks)]
+    terms = {}
+    for section in range(args.sections):
+        term = f"v{section}.{rng.integers(10)}.{rng.integers(10)}"
+        rows = rng.choice(args.chunks, size=3, replace=False)
+        for row in rows:
+            documents[row] += f" fixed in {term}"
+        terms[section] = (term, set(rows.tolist()))
+    urls = [f"https://source{i}.example.com/post" for i in range(args.sources)]
+    metadatas = [{"source_url": urls[source]} for source in source_of]
+    return embeddings, documents, metadatas, urls, centers, terms
+
+def recall(found, expected) -> float:
+    return len(set(found) & set(expected)) / len(expected) if expected else 1.0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--sources", type=int, default=60)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Simulated latency of one embedding API call in seconds.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings, documents, metadatas, urls, centers, terms = build_corpus(args, rng)
+    ids = [f"chunk_{i}" for i in range(args.chunks)]
+    stages = [f"Section {i}" for i in range(args.sections)]
+    stage_urls = {stage: list(rng.choice(urls, size=10, replace=False)) for stage in stages}
+    ranked_sources = {stage: [{"url": url} for url in stage_urls[stage]] for stage in stages}
+    queries = [f"Information about {stage} for A vs B {terms[i][0]}" for i, stage in enumerate(stages)]
+    query_embeddings = (centers[rng.integers(0, args.sources, size=args.sections)] + 0.5 * rng.normal(size=(args.sections, args.dim))).astype(np.float32)
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    exact = [np.argsort(-(normalized @ (q / np.linalg.norm(q))))[:main.RETRIEVAL_TOP_K].tolist() for q in query_embeddings]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        collection = chromadb.PersistentClient(path=workdir).create_collection("bench", embedding_function=None)
+        for start in range(0, args.chunks, 1000):
+            collection.add(ids=ids[start:start + 1000], embeddings=embeddings[start:start + 1000].tolist(),
+                           documents=documents[start:start + 1000], metadatas=metadatas[start:start + 1000])
+        row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+
+        start = time.perf_counter()
+        chroma_hits = []
+        for stage, query_embedding in zip(stages, query_embeddings):
+            time.sleep(args.embed_latency)
+            result = collection.query(query_embeddings=[query_embedding.tolist()], n_results=main.RETRIEVAL_TOP_K,
+                                      where={"source_url": {"$in": urls}}, include=["documents", "metadatas", "embeddings"])
+            collection.get(where={"source_url": {"$in": stage_urls[stage]}}, include=["documents", "metadatas", "embeddings"])
+            chroma_hits.append([row_of[chunk_id] for chunk_id in result['ids'][0]])
+        chroma_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = main.RetrievalIndex.from_collection(collection, urls, ranked_sources)
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        time.sleep(args.embed_latency)
+        index_hits = index.search(query_embeddings.tolist(), queries)
+        search_seconds = time.perf_counter() - start
+        index_hits = [[row_of[index.ids[row]] for row in rows] for rows in index_hits]
+        dense_hits = [np.argsort(-(index.matrix @ (q / np.linalg.norm(q))))[:main.RETRIEVAL_TOP_K].tolist() for q in query_embeddings]
+        dense_hits = [[row_of[index.ids[row]] for row in rows] for rows in dense_hits]
+
+    def mean(values):
+        return sum(values) / len(values)
+
+    print(f"{args.chunks} chunks, {args.sources} sources, {args.sections} sections, top {main.RETRIEVAL_TOP_K}, {args.embed_latency * 1000:.0f} ms per embedding call")
+    print(f"  chroma per section: {chroma_seconds * 1000:8.1f} ms ({args.sections} embedding calls, {2 * args.sections} collection calls)")
+    print(f"  hybrid index:       {(build_seconds + search_seconds) * 1000:8.1f} ms (1 embedding call, 1 collection call; build {build_seconds * 1000:.1f} ms, "
+          f"search {(search_seconds - args.embed_latency) * 1000:.1f} ms)")
+    print(f"  dense recall@{main.RETRIEVAL_TOP_K} vs exact cosine: chroma {mean([recall(h, e) for h, e in zip(chroma_hits, exact)]):.2f}, "
+          f"index dense {mean([recall(h, e) for h, e in zip(dense_hits, exact)]):.2f}, hybrid {mean([recall(h, e) for h, e in zip(index_hits, exact)]):.2f}")
+    print(f"  planted version-number chunks found: chroma {mean([recall(h, terms[i][1]) for i, h in enumerate(chroma_hits)]):.2f}, "
+          f"hybrid {mean([recall(h, terms[i][1]) for i, h in enumerate(index_hits)]):.2f}")
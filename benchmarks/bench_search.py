@@ -0,0 +1,46 @@
+"""Compares the serial Brave search loop with the concurrent, token-bucket limited execute_web_search node.
+
+Usage: python -m benchmarks.bench_search [--queries 12] [--qps 5] [--latency 0.4]
+"""
+import argparse
+import os
+import time
+
+import requests
+
+import main
+from benchmarks.common import BraveHandler, base_url, serve
+
+def serial_search(url, queries):
+    session = requests.Session()
+    for query in queries:
+        try:
+            session.get(url, params={"q": query, "count": 10}, timeout=15).raise_for_status()
+        except requests.exceptions.RequestException:
+            pass
+        finally:
+            time.sleep(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=12)
+    parser.add_argument("--qps", type=float, default=5.0, help="QPS enforced by the mock endpoint and the limiter.")
+    parser.add_argument("--latency", type=float, default=0.4, help="Simulated Brave response latency in seconds.")
+    args = parser.parse_args()
+
+    server = serve(BraveHandler, args.latency)
+    BraveHandler.qps = args.qps
+    url = f"{base_url(server)}/res/v1/web/search"
+    os.environ.update({"BRAVE_API_URL": url, "BRAVE_API_KEY": "mock", "BRAVE_QPS": str(args.qps)})
+    queries = [f"framework comparison query {i}" for i in range(args.queries)]
+
+    start = time.perf_counter()
+    serial_search(url, queries)
+    serial = time.perf_counter() - start
+    print(f"    serial: {serial:.2f}s for {args.queries} queries")
+
+    start = time.perf_counter()
+    state = main.execute_web_search({"search_queries": queries})
+    concurrent = time.perf_counter() - start
+    print(f"concurrent: {concurrent:.2f}s for {args.queries} queries, {len(state['raw_sources'])} sources")
+    print(f"   speedup: {serial / concurrent:.1f}x")
@@ -0,0 +1,63 @@
+"""Checks that importing main and running `main.py --help` stay within a startup budget.
+
+Parses `python -X importtime` output for the cumulative import time of main, fails if it exceeds the budget
+or if any heavy dependency is imported eagerly, and reports the slowest imports.
+
+Usage: python -m benchmarks.bench_startup [--runs 5] [--budget-ms 300] [--top 10]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["chromadb", "langchain", "langchain_core", "langchain_google_genai", "langgraph", "numpy", "pyppeteer", "requests", "tiktoken", "trafilatura"]
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def import_profile(statement: str = "import main") -> dict:
+    """Returns {module: cumulative microseconds} for one cold run of statement."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=PROJECT_ROOT,
+                               capture_output=True, text=True, check=True)
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = int(match.group(2))
+    return modules
+
+def help_seconds() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "main.py", "--help"], cwd=PROJECT_ROOT, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="Maximum median cumulative import time of main.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list.")
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    import_ms = statistics.median(profile["main"] for profile in profiles) / 1000
+    help_ms = statistics.median(help_seconds() for _ in range(args.runs)) * 1000
+    interpreter = set(import_profile("pass"))
+    eager = sorted({module.split(".")[0] for profile in profiles for module in profile} & set(HEAVY_MODULES))
+
+    print(f"import main: {import_ms:.0f} ms (median of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print(f"main.py --help: {help_ms:.0f} ms wall time including interpreter start")
+    print("slowest imports pulled in by main:")
+    own_imports = {module: micros for module, micros in profiles[-1].items() if module not in interpreter and module != "main"}
+    for module, micros in sorted(own_imports.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {micros / 1000:>8.1f} ms  {module}")
+
+    failures = []
+    if import_ms > args.budget_ms:
+        failures.append(f"import main took {import_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    if eager:
+        failures.append(f"heavy modules imported at startup: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+PARAGRAPH = "<p>Paragraph {n} of {title} describes rendering strategies, data fetching, caching layers and deployment targets of a modern web framework in enough detail for trafilatura to keep it.</p>"
+
+def html_page(title: str, paragraphs: int = 12) -> str:
+    body = "".join(PARAGRAPH.format(n=n, title=title) for n in range(paragraphs))
+    return f"<html><head><title>{title}</title></head><body><article><h1>{title}</h1>{body}</article></body></html>"
+
+def serve(handler_cls, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Starts a local HTTP server on a free port in a daemon thread."""
+    handler = type("Handler", (handler_cls,), {"latency": latency, "log_message": lambda *args: None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class PageHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = html_page(self.path).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+class BraveHandler(BaseHTTPRequestHandler):
+    """Mock Brave web search endpoint that enforces a QPS limit with 429 + Retry-After."""
+    latency = 0.0
+    qps = 0.0
+    results_per_query = 10
+    page_base_url = "http://127.0.0.1"
+    _lock = threading.Lock()
+    _last_request = 0.0
+
+    def do_GET(self):
+        from urllib.parse import parse_qs, urlparse
+        now = time.monotonic()
+        with BraveHandler._lock:
+            limited = self.qps and now - BraveHandler._last_request < 1 / self.qps * 0.9
+            if not limited:
+                BraveHandler._last_request = now
+        if limited:
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        time.sleep(self.latency)
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        slug = "-".join(query.lower().split())
+        results = [{
+            "url": f"{self.page_base_url}/{slug}/{i}",
+            "title": f"{query} result {i}",
+            "description": f"Snippet {i} discussing {query}.",
+            "page_age": "2025-06-01T00:00:00"
+        } for i in range(self.results_per_query)]
+        body = json.dumps({"web": {"results": results}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class ScriptPageHandler(BaseHTTPRequestHandler):
+    """Serves pages whose article text is injected by JavaScript, plus a slow image that a browser should block."""
+    latency = 0.0
+
+    def do_GET(self):
+        if self.path.endswith(".png"):
+            time.sleep(2)
+            self.send_response(404)
+            self.end_headers()
+            return
+        time.sleep(self.latency)
+        content = json.dumps(html_page(self.path))
+        body = (
+            "<html><head><title>SPA</title></head><body><div id='root'></div><img src='/hero.png'>"
+            f"<script>setTimeout(function() {{ document.getElementById('root').innerHTML = {content}; }}, 300);</script>"
+            "</body></html>"
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+@lru_cache(maxsize=None)
+def load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+class FixtureBraveHandler(BaseHTTPRequestHandler):
+    """Replays the recorded Brave response, with result URLs rewritten to local page hosts and as many results per query as configured."""
+    latency = 0.0
+    results_per_query = 10
+    page_base_urls = ["http://127.0.0.1"]
+
+    def do_GET(self):
+        from urllib.parse import parse_qs, urlparse
+        time.sleep(self.latency)
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        slug = "-".join(query.lower().split())
+        recorded = json.loads(load_fixture("brave_search.json"))
+        templates = recorded["web"]["results"]
+        results = []
+        for i in range(self.results_per_query):
+            result = dict(templates[i % len(templates)])
+            result["url"] = f"{self.page_base_urls[i % len(self.page_base_urls)]}/{slug}/{i}"
+            result["title"] = f"{result['title']} ({query}, part {i})"
+            result["description"] = f"{result['description']} Result {i} for {query}: {hashlib.sha1(f'{query}{i}'.encode()).hexdigest()[:12]}."
+            results.append(result)
+        recorded["query"]["original"] = query
+        recorded["web"]["results"] = results
+        body = json.dumps(recorded).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FixturePageHandler(BaseHTTPRequestHandler):
+    """Serves the recorded article pages, picked by path and given a path-specific paragraph so every URL has distinct content."""
+    latency = 0.0
+    pages = ("benchmark_article.html", "guide_article.html", "engineering_blog.html")
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        digest = hashlib.sha1(self.path.encode()).hexdigest()
+        page = load_fixture(os.path.join("pages", self.pages[int(digest, 16) % len(self.pages)]))
+        body = page.replace("<!--VARIANT-->", f"<p>This copy of the article was served at {self.path} with revision {digest}.</p>").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+class FakeMessageChunk(FakeMessage):
+    def __add__(self, other: "FakeMessageChunk") -> "FakeMessageChunk":
+        return FakeMessageChunk(self.content + other.content)
+
+class FakeChatModel:
+    """Deterministic stand-in for ChatGoogleGenerativeAI that answers each pipeline prompt after a fixed latency.
+
+    Like the real client's cached grpc.aio channel, its async methods bind to the first event loop that calls them.
+    """
+    latency = 0.0
+    stages = ["Introduction", "Performance", "Scalability", "Developer Experience", "Ecosystem", "Security", "Conclusion"]
+
+    def __init__(self, **kwargs):
+        self.loop = None
+
+    def check_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        elif self.loop is not loop:
+            raise RuntimeError("async client is bound to a different event loop")
+
+    def answer(self, prompt: str) -> str:
+        if "planning a technical report" in prompt:
+            queries_per_stage = int(re.search(r"write (\d+) diverse", prompt).group(1))
+            return json.dumps({
+                "is_comparable": True,
+                "report_stages": self.stages,
+                "search_queries": {stage: [f"{stage} comparison benchmarks", f"{stage} migration experience", f"{stage} official documentation"][:queries_per_stage] for stage in self.stages}
+            })
+        if '"is_comparable"' in prompt:
+            return '{"is_comparable": true}'
+        if "JSON array of the chosen section titles" in prompt:
+            return json.dumps(self.stages)
+        if "search query expert" in prompt:
+            return re.search(r'report section "(.*?)"', prompt).group(1) + " comparison benchmarks"
+        if "Actual Input:" in prompt:
+            technologies = json.loads(re.search(r"report on (\[.*?\])\.", prompt).group(1))
+            sources = json.loads(prompt.rsplit("Actual Input:\n", 1)[1])
+            stage_names = re.search(r"report sections: (\[.*?\])\.", prompt)
+            stages = json.loads(stage_names.group(1)) if stage_names else [re.search(r'report section: "(.*?)"', prompt).group(1)]
+
+            def score(source, stage):
+                return int(hashlib.sha1(f"{source['id']}{stage}".encode()).hexdigest(), 16) % 100 / 100
+
+            if stage_names:
+                return json.dumps([{"id": s["id"], "discussed_technologies": technologies, "relevance_scores": {stage: score(s, stage) for stage in stages}} for s in sources])
+            return json.dumps([{"id": s["id"], "discussed_technologies": technologies, "relevance_score": score(s, stages[0])} for s in sources])
+        if "## Final Assessment" in prompt:
+            return "## Final Assessment\nBoth technologies fit different use cases."
+        return "The analyzed sources compare throughput, latency and developer experience.\n\n### Sources\n- fixture"
+
+    def invoke(self, prompt: str) -> FakeMessage:
+        time.sleep(self.latency)
+        return FakeMessage(self.answer(prompt))
+
+    async def ainvoke(self, prompt: str) -> FakeMessage:
+        self.check_loop()
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self.answer(prompt))
+
+    def chunks(self, prompt: str) -> List[FakeMessageChunk]:
+        return [FakeMessageChunk(token) for token in re.findall(r"\S+\s*", self.answer(prompt))]
+
+    def stream(self, prompt: str):
+        """Yields word chunks spread evenly over the configured latency."""
+        chunks = self.chunks(prompt)
+        for chunk in chunks:
+            time.sleep(self.latency / len(chunks))
+            yield chunk
+
+    async def astream(self, prompt: str):
+        self.check_loop()
+        chunks = self.chunks(prompt)
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+class FakeEmbeddings:
+    """Deterministic stand-in for GoogleGenerativeAIEmbeddings with a fixed latency per batch call."""
+    latency = 0.0
+    dimensions = 64
+
+    def __init__(self, **kwargs):
+        pass
+
+    def vector(self, text: str) -> List[float]:
+        digest = hashlib.sha512(text.encode()).digest()
+        return [byte / 255 - 0.5 for byte in digest[:self.dimensions]]
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        time.sleep(self.latency)
+        return self.vector(text)
@@ -1,40 +1,60 @@
-from typing import TypedDict, List, Literal, Dict, Optional
+from typing import TYPE_CHECKING, TypedDict, List, Literal, Dict, Optional, Tuple
+from collections import Counter
 from datetime import datetime
-import chromadb
 import time
 import logging
-import requests
-import tiktoken
-from urllib.parse import urlparse
-import trafilatura
-import requests_html
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain.docstore.document import Document
-from langchain_chroma import Chroma
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+import sqlite3
+import hashlib
+import random
+import re
+import asyncio
+import atexit
+from functools import lru_cache
+from urllib.parse import urlparse, urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 import os
 import json
-from langchain_core.output_parsers import JsonOutputParser
-from langgraph.graph import END, StateGraph
 import argparse
+import sys
+import uuid
+import contextvars
 from dotenv import load_dotenv
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Heavy dependencies are imported inside the functions that use them to keep startup fast.
+if TYPE_CHECKING:
+    import chromadb
+    import numpy as np
+    import requests
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
 # --- Constants ---
 RANKING_TOKEN_LIMIT = 12000
+RANKING_OUTPUT_TOKENS_PER_STAGE = 10
+MIN_EXTRACTED_CHARS = 250
+NON_RESEARCH_STAGES = ["introduction", "conclusion", "final assessment"]
 
 # --- Logging Configuration ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s ℹ️  %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler("logs.txt", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def configure_logging() -> None:
+    """Sends logs to the console and logs.txt. Called by the CLI rather than at import time."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s ℹ️  %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.FileHandler("logs.txt", encoding='utf-8'),
+            logging.StreamHandler()
+        ]
+    )
+
 # --- Prompts ---
 PROMPT_VALIDATE_COMPARISON = '''You are a technology classification expert. The user wants to compare the following technologies: {technologies}.
 Are these technologies directly comparable for a detailed technical report? For example, "Next.js" and "Nuxt.js" are comparable (both are full-stack frameworks). "Next.js" and "Formik" are not (one is a framework, one is a form library).
@@ -59,6 +79,20 @@ The query must be comparative. For example, for "Performance", a good query woul
 Return only the single search query. Do not add any other text.
 '''
 
+PROMPT_PLAN_REPORT = '''You are a technology analyst planning a technical report on: **{technologies}**. The report mode is: **{report_mode}**. The current year is {year}.
+Complete all three tasks in one response:
+1.  If the report mode is "comparison", decide whether these technologies are directly comparable for a detailed technical report. For example, "Next.js" and "Nuxt.js" are comparable (both are full-stack frameworks). "Next.js" and "Formik" are not (one is a framework, one is a form library). If the report mode is "single", answer true.
+2.  Choose the report's section titles. For "single", use a standard structure such as ["Introduction", "Core Architecture", "Performance", "Developer Experience", "Ecosystem", "Conclusion"]. For "comparison", use clear, direct titles that compare the technologies, such as ["Introduction", "Core Architecture and Philosophy", "Rendering Strategies and Performance", "Data Fetching and Mutations", "Developer Experience and Tooling", "Conclusion", "Final Assessment"]. **Do not repeat "Comparative Analysis" in every title.**
+3.  For every section except "Introduction", "Conclusion" and "Final Assessment", write {queries_per_stage} diverse, highly effective Brave Search queries. Each query must be comparative and approach the section from a different angle (for example benchmarks, migration experiences, official documentation).
+
+Respond with only a single, valid JSON object in this format:
+{{
+  "is_comparable": true,
+  "report_stages": ["Introduction", "Performance", "Conclusion"],
+  "search_queries": {{ "Performance": ["query 1", "query 2"] }}
+}}
+'''
+
 PROMPT_RANK_SOURCES = '''You are a data analyst. The user wants a report on {technologies}. For each source in the JSON list below, perform two tasks:
 1.  Identify which of the listed technologies are discussed in the source's title and snippet.
 2.  Determine the source's relevance to the report section: "{stage_name}". Rate relevance on a scale from 0.0 to 1.0.
@@ -89,6 +123,36 @@ Actual Input:
 {batch_of_sources}
 '''
 
+PROMPT_RANK_SOURCES_MULTI_STAGE = '''You are a data analyst. The user wants a report on {technologies}. For each source in the JSON list below, perform two tasks:
+1.  Identify which of the listed technologies are discussed in the source's title and snippet.
+2.  Determine the source's relevance to each of these report sections: {stage_names}. Rate each relevance on a scale from 0.0 to 1.0.
+
+Respond with only a single, valid JSON array. Each object in the array should correspond to an input source and contain its ID, the list of `discussed_technologies`, and `relevance_scores`, an object mapping every section title to its score.
+
+Example Input (sections: ["Performance", "Developer Experience"]):
+[
+  {{ "id": 1, "title": "Next.js vs Remix Performance", "snippet": "..." }},
+  {{ "id": 2, "title": "Getting Started with SvelteKit", "snippet": "..." }}
+]
+
+Example Output:
+[
+  {{
+    "id": 1,
+    "discussed_technologies": ["Next.js", "Remix"],
+    "relevance_scores": {{ "Performance": 0.9, "Developer Experience": 0.3 }}
+  }},
+  {{
+    "id": 2,
+    "discussed_technologies": ["SvelteKit"],
+    "relevance_scores": {{ "Performance": 0.1, "Developer Experience": 0.4 }}
+  }}
+]
+
+Actual Input:
+{batch_of_sources}
+'''
+
 PROMPT_WRITE_SECTION = '''You are a meticulous Senior Technology Analyst writing a technical report for a CTO. Your tone must be objective, data-driven, and deeply technical.
 Your current task is to write the "{stage_name}" section of the report.
 If the report is a comparison of {technologies}, you must synthesize information and create a comparative analysis for this section.
@@ -134,43 +198,1213 @@ class ResearchState(TypedDict):
     search_queries: Optional[List[str]]
     raw_sources: Optional[List[Dict]]
     ranked_sources: Optional[Dict[str, List[Dict]]]
-    vector_store: Optional[chromadb.Collection]
-    chroma_client: Optional[chromadb.Client]
+    crawled_urls: Optional[List[str]]
+    crawled_content_hashes: Optional[Dict[str, str]]
+    crawl_stats: Optional[Dict]
     report_draft: Optional[str]
     final_report: Optional[str]
     reviewer_notes: Optional[str]
+    report_manifest: Optional[Dict]
+
+# --- Disk Cache ---
+class DiskCache:
+    """SQLite-backed key/value store with optional TTL and size-bounded LRU eviction."""
+
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        cache_dir = os.getenv("CACHE_DIR", "./cache")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{name}.sqlite")
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, created_at REAL, accessed_at REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        logger.info(f"Opened disk cache '{name}' at {self.path} ({self.total_bytes / 1e6:.1f} MB).")
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds:
+                self._delete(key)
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, object]:
+        """Returns the unexpired entries among keys, reading and touching them in one transaction."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self.lock:
+            rows = []
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows += self.conn.execute(f"SELECT key, value, created_at FROM cache WHERE key IN ({','.join('?' * len(batch))})", batch).fetchall()
+            found = {}
+            for key, value, created_at in rows:
+                if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                    self._delete(key)
+                else:
+                    found[key] = value
+            self.conn.executemany("UPDATE cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            self.conn.commit()
+        return found
+
+    def set(self, key: str, value) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: List[Tuple[str, object]]) -> None:
+        """Stores several entries in one transaction."""
+        now = time.time()
+        with self.lock:
+            for key, value in items:
+                self._delete(key)
+                self.conn.execute("INSERT INTO cache VALUES (?, ?, ?, ?, ?)", (key, value, len(value), now, now))
+                self.total_bytes += len(value)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self._delete(key)
+            self.conn.commit()
+
+    def items(self) -> List[Tuple[str, bytes]]:
+        """Returns every unexpired entry without updating access times."""
+        with self.lock:
+            rows = self.conn.execute("SELECT key, value, created_at FROM cache").fetchall()
+        now = time.time()
+        return [(key, value) for key, value, created_at in rows if self.ttl_seconds is None or now - created_at <= self.ttl_seconds]
+
+    def _delete(self, key: str) -> None:
+        row = self.conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+        if row:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.total_bytes -= row[0]
+
+    def _evict(self) -> None:
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for key, size in self.conn.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall():
+            if self.total_bytes <= target:
+                break
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.total_bytes -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} entries from {self.path}.")
+
+# --- Instrumentation ---
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+_current_node: contextvars.ContextVar = contextvars.ContextVar("current_node", default=None)
+
+class RunProfile:
+    """Thread-safe collector of timed spans and per-node counters for one run."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.trace_id = uuid.uuid4().hex
+        self.started = time.time()
+        self.spans: List[Dict] = []
+        self.nodes: Dict[str, Counter] = {}
+        self.lock = threading.Lock()
+
+    def add_span(self, name: str, kind: str, start: float, end: float, span_id: Optional[str] = None, **attributes) -> None:
+        node = _current_node.get()
+        node_name, node_span_id = node if node else ("(outside nodes)", None)
+        span = {
+            "span_id": span_id or uuid.uuid4().hex[:16],
+            "parent_span_id": None if kind == "node" else node_span_id,
+            "name": name,
+            "kind": kind,
+            "start": start,
+            "end": end,
+            "attributes": attributes,
+        }
+        with self.lock:
+            self.spans.append(span)
+            counters = self.nodes.setdefault(node_name, Counter())
+            if kind == "node":
+                counters["wall_seconds"] += end - start
+            else:
+                counters[f"{kind}_calls"] += 1
+                counters[f"{kind}_seconds"] += end - start
+            for key, value in attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    counters[key] += value
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                "run_id": self.run_id,
+                "trace_id": self.trace_id,
+                "started": self.started,
+                "wall_seconds": time.time() - self.started,
+                "nodes": {node: dict(counters) for node, counters in self.nodes.items()},
+                "spans": list(self.spans),
+            }
+
+    def to_otel(self) -> Dict:
+        """Exports spans in the OTLP/JSON trace layout."""
+        def attribute(key, value):
+            kind = "boolValue" if isinstance(value, bool) else "intValue" if isinstance(value, int) else "doubleValue" if isinstance(value, float) else "stringValue"
+            return {"key": key, "value": {kind: str(value) if kind in ("stringValue", "intValue") else value}}
+
+        spans = [{
+            "traceId": self.trace_id,
+            "spanId": span["span_id"],
+            "parentSpanId": span["parent_span_id"] or "",
+            "name": span["name"],
+            "kind": 1 if span["kind"] == "node" else 3,
+            "startTimeUnixNano": str(int(span["start"] * 1e9)),
+            "endTimeUnixNano": str(int(span["end"] * 1e9)),
+            "attributes": [attribute(k, v) for k, v in span["attributes"].items()],
+        } for span in self.to_dict()["spans"]]
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", "research-agent"), attribute("run.id", self.run_id)]},
+            "scopeSpans": [{"scope": {"name": "research-agent"}, "spans": spans}],
+        }]}
+
+    def summary_table(self) -> str:
+        columns = [("wall_seconds", "wall s"), ("llm_calls", "LLM calls"), ("input_tokens", "tokens in"), ("output_tokens", "tokens out"),
+                   ("http_calls", "HTTP calls"), ("bytes", "bytes"), ("embedding_texts", "embed texts"), ("cache_hits", "cache hits")]
+        profile = self.to_dict()
+        rows = [["node"] + [title for _, title in columns]]
+        for node, counters in profile["nodes"].items():
+            rows.append([node] + [f"{counters.get(key, 0):.2f}" if key.endswith("seconds") else str(int(counters.get(key, 0))) for key, _ in columns])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))) for row in rows]
+        lines.insert(1, "-" * len(lines[0]))
+        lines.append(f"Total wall time: {profile['wall_seconds']:.2f}s")
+        return "\n".join(lines)
+
+    def save(self) -> str:
+        profile_dir = os.getenv("PROFILE_DIR", "./profiles")
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"profile_{self.run_id}.json")
+        with open(path, "w", encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        if os.getenv("PROFILE_OTEL_SPANS", "false").lower() == "true":
+            with open(os.path.join(profile_dir, f"profile_{self.run_id}.otel.json"), "w", encoding='utf-8') as f:
+                json.dump(self.to_otel(), f)
+        logger.info(f"Run profile saved to {path}.")
+        return path
+
+def record_span(name: str, kind: str, start: float, **attributes) -> None:
+    """Records a span that started at time.time() value `start` and ends now, if a run profile is active."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_span(name, kind, start, time.time(), **attributes)
+
+def instrument_node(name: str, node):
+    def instrumented(state: ResearchState) -> ResearchState:
+        span_id = uuid.uuid4().hex[:16]
+        token = _current_node.set((name, span_id))
+        start = time.time()
+        try:
+            return node(state)
+        finally:
+            record_span(name, "node", start, span_id=span_id)
+            _current_node.reset(token)
+    return instrumented
+
+def submit_in_context(executor: ThreadPoolExecutor, fn, *args):
+    """Submits fn so it runs with the caller's context variables (run profile and current node)."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """Thread-safe token bucket. reserve() books capacity up front and returns how long the caller must wait."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, amount: float = 1.0) -> float:
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
 
 # --- LLM Service ---
-last_pro_call = 0
-last_flash_call = 0
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+def _is_quota_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource_exhausted" in message or "resource exhausted" in message
+
+def semantic_cache_key(template: str, variable_text: str, **fields) -> Tuple[str, str]:
+    """Scopes semantic cache lookups to one prompt template and exact values of fields; only variable_text is embedded."""
+    scope = hashlib.sha256(json.dumps([template, fields], sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return scope, variable_text
+
+class LLMResponseCache:
+    """Two-layer LLM response cache: exact match on model+prompt, plus an optional lookup by embedding similarity.
+
+    The semantic layer only compares prompts with the same scope (model, template and exact non-variable fields) and
+    embeds only their variable text, so near-identical technology names can share a response but a different stage,
+    year or template never does.
+    """
+
+    def __init__(self):
+        ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", "604800"))
+        max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1e6)
+        self.exact = DiskCache("llm_responses", max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.semantic_enabled = os.getenv("LLM_SEMANTIC_CACHE", "false").lower() == "true"
+        self.threshold = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+        self.prompt_vectors = DiskCache("llm_prompt_vectors", max_bytes=max_bytes // 4, ttl_seconds=ttl_seconds) if self.semantic_enabled else None
+        self.index: Optional[Dict[str, Tuple[List[str], List[List[float]]]]] = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def _load_index(self) -> Dict[str, Tuple[List[str], List[List[float]]]]:
+        import numpy as np
+        if self.index is None:
+            self.index = {}
+            for vector_key, value in self.prompt_vectors.items():
+                scope, key = vector_key.rsplit(":", 1)
+                keys, vectors = self.index.setdefault(scope, ([], []))
+                keys.append(key)
+                vectors.append(np.frombuffer(value, dtype=np.float32))
+            logger.info(f"Loaded {sum(len(keys) for keys, _ in self.index.values())} prompt embeddings for the semantic LLM cache.")
+        return self.index
+
+    def _text_vector(self, text: str):
+        import numpy as np
+        vector = np.asarray(get_embedding_service().embed_query(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def get(self, model: str, prompt: str, semantic_key: Optional[Tuple[str, str]] = None) -> Tuple[Optional[str], Optional[str]]:
+        """Returns the cached response text and which layer ('exact' or 'semantic') it came from."""
+        cached = self.exact.get(self.key(model, prompt))
+        if cached is not None:
+            return cached, "exact"
+        if semantic_key is None or not self.semantic_enabled:
+            return None, None
+        import numpy as np
+        scope, text = semantic_key
+        query = self._text_vector(text)
+        with self.lock:
+            keys, vectors = self._load_index().get(self.key(model, scope), ([], []))
+            if not keys:
+                return None, None
+            similarities = np.stack(vectors) @ query
+            best = int(np.argmax(similarities))
+            best_key, similarity = keys[best], float(similarities[best])
+        if similarity < self.threshold:
+            return None, None
+        cached = self.exact.get(best_key)
+        if cached is None:
+            return None, None
+        logger.info(f"Semantic LLM cache hit with similarity {similarity:.3f}.")
+        return cached, "semantic"
+
+    def set(self, model: str, prompt: str, content: str, semantic_key: Optional[Tuple[str, str]] = None) -> None:
+        key = self.key(model, prompt)
+        self.exact.set(key, content)
+        if semantic_key is not None and self.semantic_enabled:
+            scope, text = semantic_key
+            vector = self._text_vector(text)
+            self.prompt_vectors.set(f"{self.key(model, scope)}:{key}", vector.tobytes())
+            with self.lock:
+                keys, vectors = self._load_index().setdefault(self.key(model, scope), ([], []))
+                keys.append(key)
+                vectors.append(vector)
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    global _llm_cache
+    if os.getenv("LLM_CACHE", "true").lower() != "true":
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+            logger.info(f"LLM response cache enabled (semantic layer {'on' if _llm_cache.semantic_enabled else 'off'}).")
+        return _llm_cache
+
+class LLMService:
+    """Shared client for one model type with RPM/TPM budgets, quota retries and per-model call metrics."""
+
+    def __init__(self, model_type: Literal["pro", "flash"]):
+        prefix = model_type.upper()
+        self.model_type = model_type
+        self.model_name = os.getenv(f"GEMINI_{prefix}_MODEL")
+        min_interval = float(os.getenv(f"LLM_{prefix}_RATE_LIMIT_SECONDS", "1.1" if model_type == "pro" else "0.5"))
+        rpm = float(os.getenv(f"LLM_{prefix}_RPM", str(60 / min_interval)))
+        tpm = float(os.getenv(f"LLM_{prefix}_TPM", "1000000"))
+        self.request_bucket = TokenBucket(rate=rpm / 60, capacity=1.0)
+        self.token_bucket = TokenBucket(rate=tpm / 60, capacity=tpm)
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        self.client = ChatGoogleGenerativeAI(model=self.model_name, temperature=0.0, timeout=120)
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.cache_hits = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latencies: List[float] = []
+        logger.info(f"Created {model_type.upper()} LLM service for {self.model_name} ({rpm:.0f} RPM, {tpm:.0f} TPM).")
+
+    def _reserve(self, prompt: str) -> Tuple[float, int]:
+        prompt_tokens = len(get_tokenizer().encode(prompt))
+        wait = max(self.request_bucket.reserve(), self.token_bucket.reserve(prompt_tokens))
+        if wait > 0:
+            logger.info(f"Rate limiting {self.model_type.upper()} model. Waiting {wait:.2f} seconds.")
+        return wait, prompt_tokens
+
+    def _record(self, started: float, prompt_tokens: int, response) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        input_tokens = usage.get("input_tokens", prompt_tokens)
+        output_tokens = usage.get("output_tokens", len(get_tokenizer().encode(str(response.content))))
+        latency = time.perf_counter() - started
+        with self.stats_lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.latencies.append(latency)
+        record_span(f"llm.{self.model_type}", "llm", time.time() - latency, model=self.model_name, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        if attempt >= self.max_retries or not _is_quota_error(error):
+            raise error
+        delay = 2 ** attempt + random.uniform(0, 1)
+        logger.warning(f"Quota error from {self.model_type.upper()} model: {error}. Retrying in {delay:.2f} seconds.")
+        return delay
+
+    def _cached(self, prompt: str, cache: Literal["exact", "semantic", "none"], semantic_key: Optional[Tuple[str, str]]):
+        """Returns a cached response message, or None. 'semantic' also accepts responses cached under the same
+        semantic_key scope (see semantic_cache_key) whose variable text is near-identical; without a key it is 'exact'."""
+        llm_cache = get_llm_cache() if cache != "none" else None
+        if llm_cache is None:
+            return None
+        start = time.time()
+        content, layer = llm_cache.get(self.model_name, prompt, semantic_key if cache == "semantic" else None)
+        if content is None:
+            return None
+        from langchain_core.messages import AIMessage
+        with self.stats_lock:
+            self.cache_hits += 1
+        record_span(f"llm.{self.model_type}.cache", "cache", start, layer=layer, cache_hits=1)
+        return AIMessage(content=content)
+
+    def forget(self, prompt: str) -> None:
+        """Drops a cached response, e.g. one the caller could not parse."""
+        llm_cache = get_llm_cache()
+        if llm_cache is not None:
+            llm_cache.exact.delete(llm_cache.key(self.model_name, prompt))
+
+    def _store(self, prompt: str, response, cache: Literal["exact", "semantic", "none"], semantic_key: Optional[Tuple[str, str]]) -> None:
+        llm_cache = get_llm_cache() if cache != "none" else None
+        if llm_cache is not None and isinstance(response.content, str):
+            llm_cache.set(self.model_name, prompt, response.content, semantic_key if cache == "semantic" else None)
+
+    def invoke(self, prompt: str, cache: Literal["exact", "semantic", "none"] = "exact", semantic_key: Optional[Tuple[str, str]] = None):
+        cached = self._cached(prompt, cache, semantic_key)
+        if cached is not None:
+            return cached
+        for attempt in range(self.max_retries + 1):
+            wait, prompt_tokens = self._reserve(prompt)
+            time.sleep(wait)
+            started = time.perf_counter()
+            try:
+                response = self.client.invoke(prompt)
+            except Exception as e:
+                time.sleep(self._backoff(attempt, e))
+                continue
+            self._record(started, prompt_tokens, response)
+            self._store(prompt, response, cache, semantic_key)
+            return response
+
+    def stream(self, prompt: str, on_token, cache: Literal["exact", "semantic", "none"] = "exact", semantic_key: Optional[Tuple[str, str]] = None):
+        """Like invoke, but passes each text chunk to on_token as it arrives. Retries only before the first chunk."""
+        cached = self._cached(prompt, cache, semantic_key)
+        if cached is not None:
+            on_token(cached.content)
+            return cached
+        from langchain_core.messages import AIMessageChunk
+        for attempt in range(self.max_retries + 1):
+            wait, prompt_tokens = self._reserve(prompt)
+            time.sleep(wait)
+            started = time.perf_counter()
+            response = None
+            try:
+                for chunk in self.client.stream(prompt):
+                    on_token(chunk.content)
+                    response = chunk if response is None else response + chunk
+            except Exception as e:
+                if response is not None:
+                    raise
+                time.sleep(self._backoff(attempt, e))
+                continue
+            response = response or AIMessageChunk(content="")
+            self._record(started, prompt_tokens, response)
+            self._store(prompt, response, cache, semantic_key)
+            return response
+
+    async def astream(self, prompt: str, on_token, cache: Literal["exact", "semantic", "none"] = "exact", semantic_key: Optional[Tuple[str, str]] = None):
+        cached = self._cached(prompt, cache, semantic_key)
+        if cached is not None:
+            on_token(cached.content)
+            return cached
+        from langchain_core.messages import AIMessageChunk
+        for attempt in range(self.max_retries + 1):
+            wait, prompt_tokens = self._reserve(prompt)
+            await asyncio.sleep(wait)
+            started = time.perf_counter()
+            response = None
+            try:
+                async for chunk in self.client.astream(prompt):
+                    on_token(chunk.content)
+                    response = chunk if response is None else response + chunk
+            except Exception as e:
+                if response is not None:
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            response = response or AIMessageChunk(content="")
+            self._record(started, prompt_tokens, response)
+            self._store(prompt, response, cache, semantic_key)
+            return response
+
+    async def ainvoke(self, prompt: str, cache: Literal["exact", "semantic", "none"] = "exact", semantic_key: Optional[Tuple[str, str]] = None):
+        cached = self._cached(prompt, cache, semantic_key)
+        if cached is not None:
+            return cached
+        for attempt in range(self.max_retries + 1):
+            wait, prompt_tokens = self._reserve(prompt)
+            await asyncio.sleep(wait)
+            started = time.perf_counter()
+            try:
+                response = await self.client.ainvoke(prompt)
+            except Exception as e:
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            self._record(started, prompt_tokens, response)
+            self._store(prompt, response, cache, semantic_key)
+            return response
+
+    def metrics(self) -> Dict:
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+        percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        return {
+            "model": self.model_name,
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+        }
+
+_llm_services: Dict[str, LLMService] = {}
+_llm_lock = threading.Lock()
 
-def get_llm(model_type: Literal["pro", "flash"]) -> ChatGoogleGenerativeAI:
-    global last_pro_call, last_flash_call
+def get_llm(model_type: Literal["pro", "flash"]) -> LLMService:
     logger.info(f"Requesting LLM of type: {model_type}")
-    now = time.time()
-    if model_type == "pro":
-        wait_time_str = os.getenv("LLM_PRO_RATE_LIMIT_SECONDS", "1.1")
-        wait_time = float(wait_time_str) - (now - last_pro_call)
-        if wait_time > 0:
-            logger.info(f"Rate limiting PRO model. Sleeping for {wait_time:.2f} seconds.")
-            time.sleep(wait_time)
-        last_pro_call = time.time()
-        model_name = os.getenv("GEMINI_PRO_MODEL")
-    else:
-        wait_time_str = os.getenv("LLM_FLASH_RATE_LIMIT_SECONDS", "0.5")
-        wait_time = float(wait_time_str) - (now - last_flash_call)
-        if wait_time > 0:
-            logger.info(f"Rate limiting FLASH model. Sleeping for {wait_time:.2f} seconds.")
-            time.sleep(wait_time)
-        last_flash_call = time.time()
-        model_name = os.getenv("GEMINI_FLASH_MODEL")
-    
-    logger.info(f"Returning {model_name} instance.")
-    return ChatGoogleGenerativeAI(model=model_name, temperature=0.0, timeout=120)
+    with _llm_lock:
+        if model_type not in _llm_services:
+            _llm_services[model_type] = LLMService(model_type)
+        return _llm_services[model_type]
+
+_async_loop = None
+
+def run_async(coro):
+    """Runs coro on the process-wide event loop thread and waits for its result.
+
+    The shared LLM clients create their async grpc channel once, bound to the loop that first used it, so every
+    coroutine that awaits them must run on this one long-lived loop rather than on a new asyncio.run loop per report.
+    """
+    global _async_loop
+    with _llm_lock:
+        if _async_loop is None:
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, name="async-llm", daemon=True).start()
+            logger.info("Started the shared async LLM event loop.")
+    return asyncio.run_coroutine_threadsafe(coro, _async_loop).result()
+
+def log_llm_metrics() -> None:
+    for model_type, service in _llm_services.items():
+        m = service.metrics()
+        logger.info(f"LLM metrics [{model_type}]: {m['calls']} calls, {m['cache_hits']} cache hits, {m['input_tokens']} input / {m['output_tokens']} output tokens, p50 {m['latency_p50']:.2f}s, p95 {m['latency_p95']:.2f}s.")
+
+# --- Brave Search ---
+_brave_bucket = None
+_search_cache = None
+_brave_lock = threading.Lock()
+
+def get_brave_bucket() -> TokenBucket:
+    global _brave_bucket
+    with _brave_lock:
+        if _brave_bucket is None:
+            qps = float(os.getenv("BRAVE_QPS", "1"))
+            _brave_bucket = TokenBucket(rate=qps, capacity=1.0)
+            logger.info(f"Brave Search rate limiter set to {qps} queries per second.")
+        return _brave_bucket
+
+def get_search_cache() -> DiskCache:
+    global _search_cache
+    with _brave_lock:
+        if _search_cache is None:
+            _search_cache = DiskCache("searches", max_bytes=50_000_000, ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "86400")))
+        return _search_cache
+
+def brave_search(session: "requests.Session", query: str, headers: Dict) -> Tuple[List[Dict], float, int]:
+    """Runs one rate-limited Brave query, retrying 429s. Returns results, latency and retry count."""
+    max_retries = int(os.getenv("BRAVE_MAX_RETRIES", "3"))
+    start = time.perf_counter()
+    for attempt in range(max_retries + 1):
+        get_brave_bucket().acquire()
+        response = session.get(
+            os.getenv("BRAVE_API_URL", "https://api.search.brave.com/res/v1/web/search"),
+            headers=headers,
+            params={"q": query, "count": 10, "text_decorations": False},
+            timeout=15
+        )
+        if response.status_code == 429 and attempt < max_retries:
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                retry_after = 2 ** attempt
+            delay = retry_after + random.uniform(0, retry_after / 2 + 0.1)
+            logger.warning(f"Brave rate limit hit for query '{query}'. Retrying in {delay:.2f} seconds.")
+            time.sleep(delay)
+            continue
+        response.raise_for_status()
+        latency = time.perf_counter() - start
+        record_span("http.brave", "http", time.time() - latency, bytes=len(response.content), retries=attempt)
+        return response.json().get("web", {}).get("results", []), latency, attempt
+
+def open_search_session(max_workers: int) -> Tuple["requests.Session", Dict]:
+    """Returns a pooled session sized for max_workers concurrent queries and the Brave request headers."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    brave_api_key = os.getenv("BRAVE_API_KEY")
+    if not brave_api_key:
+        logger.error("BRAVE_API_KEY environment variable not set.")
+        raise ValueError("BRAVE_API_KEY environment variable not set.")
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session, {"X-Subscription-Token": brave_api_key, "Accept": "application/json"}
+
+def run_search_query(session: "requests.Session", headers: Dict, query: str) -> Tuple[List[Dict], Optional[float], int]:
+    """Runs one query through the search cache. Errors are logged and yield no results."""
+    import requests
+    cached = get_search_cache().get(query)
+    if cached is not None:
+        results = json.loads(cached)
+        record_span("search.cache", "cache", time.time(), cache_hits=1)
+        logger.info(f"Using {len(results)} cached results for query: '{query}'")
+        return results, None, 0
+    logger.info(f"Executing search for query: '{query}'")
+    try:
+        results, latency, retries = brave_search(session, query, headers)
+        get_search_cache().set(query, json.dumps(results))
+        logger.info(f"Found {len(results)} results for query '{query}' in {latency:.2f}s with {retries} retries.")
+        return results, latency, retries
+    except requests.exceptions.Timeout:
+        logger.warning(f"Search query '{query}' timed out.")
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"HTTP error for query '{query}': {e}")
+        if 400 <= e.response.status_code < 500:
+            logger.critical("Critical API key or request error. Please check your BRAVE_API_KEY.")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"An unexpected error occurred for query '{query}': {e}")
+    return [], None, 0
+
+def log_search_metrics(latencies: List[float], total_retries: int, query_count: int) -> None:
+    if latencies:
+        latencies = sorted(latencies)
+        logger.info(f"Search metrics: {len(latencies)}/{query_count} queries succeeded, p50 latency {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s, {total_retries} retries.")
+
+# --- Source Deduplication ---
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+SIMHASH_MAX_DISTANCE = 3
+# Titles and snippets shorter than this many word 3-grams are deduplicated by URL only: a fingerprint of a few
+# shingles, e.g. a shared title with an empty snippet, would collapse different pages.
+SIMHASH_MIN_SHINGLES = 8
+
+@lru_cache(maxsize=4096)
+def canonicalize_url(url: str) -> str:
+    """Normalizes scheme, host, trailing slash, tracking parameters and fragment so URL variants compare equal."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").removeprefix("www.")
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit(("https", host, parts.path.rstrip("/") or "/", query, ""))
+
+def simhash(text: str) -> Optional[int]:
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(0, len(words) - 2))}
+    if len(shingles) < SIMHASH_MIN_SHINGLES:
+        return None
+    import numpy as np
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingles], dtype=np.uint64)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    return int.from_bytes(np.packbits(bits.sum(axis=0) * 2 > len(hashes)).tobytes(), 'big')
+
+class SourceDeduplicator:
+    """Keeps the first result per canonical URL and, optionally, per near-identical title+snippet, one result at a time."""
+
+    def __init__(self):
+        self.near_duplicates = os.getenv("DEDUP_NEAR_DUPLICATES", "true").lower() == "true"
+        self.seen_urls = set()
+        self.bands: List[Dict[int, List[int]]] = [{} for _ in range(SIMHASH_MAX_DISTANCE + 1)]
+        self.band_bits = 64 // len(self.bands)
+        self.url_duplicates = 0
+        self.near_duplicate_count = 0
+
+    def add(self, result: Dict) -> bool:
+        """Returns True if result is new, recording it so later variants are rejected."""
+        key = canonicalize_url(result['url'])
+        if key in self.seen_urls:
+            self.url_duplicates += 1
+            return False
+        self.seen_urls.add(key)
+        fingerprint = simhash(f"{result.get('title', '')} {result.get('description', '')}") if self.near_duplicates else None
+        if fingerprint is not None:
+            band_keys = [(fingerprint >> (self.band_bits * i)) & ((1 << self.band_bits) - 1) for i in range(len(self.bands))]
+            if any((fingerprint ^ other).bit_count() <= SIMHASH_MAX_DISTANCE for band, band_key in zip(self.bands, band_keys) for other in band.get(band_key, [])):
+                self.near_duplicate_count += 1
+                return False
+            for band, band_key in zip(self.bands, band_keys):
+                band.setdefault(band_key, []).append(fingerprint)
+        return True
+
+    def log_summary(self) -> None:
+        logger.info(f"Deduplication dropped {self.url_duplicates} URL variants and {self.near_duplicate_count} near-duplicate sources.")
+
+def deduplicate_sources(results: List[Dict]) -> List[Dict]:
+    """Keeps the first result per canonical URL and, optionally, per near-identical title+snippet, in one ordered pass."""
+    deduplicator = SourceDeduplicator()
+    unique_sources = [result for result in results if deduplicator.add(result)]
+    deduplicator.log_summary()
+    return unique_sources
+
+# --- Domain Authority ---
+class DomainAuthorityIndex:
+    """Scores URLs by the most specific matching rule: host suffixes on label boundaries, optionally with a path prefix."""
+
+    def __init__(self, tiers: Dict[str, List[str]], default: float):
+        self.default = default
+        self.hosts: Dict[str, float] = {}
+        self.paths: Dict[str, List[Tuple[str, float]]] = {}
+        for score, rules in tiers.items():
+            for rule in rules:
+                host, _, path = rule.lower().strip().partition("/")
+                host = host.removeprefix("www.")
+                if path:
+                    self.paths.setdefault(host, []).append(("/" + path.rstrip("/"), float(score)))
+                else:
+                    self.hosts[host] = max(float(score), self.hosts.get(host, 0.0))
+        for prefixes in self.paths.values():
+            prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def score(self, url: str) -> float:
+        parts = urlsplit(url if "//" in url else f"//{url}")
+        labels = (parts.hostname or "").removeprefix("www.").split(".")
+        path = parts.path.rstrip("/").lower()
+        for i in range(len(labels) - 1):
+            suffix = ".".join(labels[i:])
+            for prefix, score in self.paths.get(suffix, []):
+                if path == prefix or path.startswith(prefix + "/"):
+                    return score
+            if suffix in self.hosts:
+                return self.hosts[suffix]
+        return self.default
+
+_domain_index = None
+_domain_lock = threading.Lock()
+
+def get_domain_index() -> DomainAuthorityIndex:
+    global _domain_index
+    with _domain_lock:
+        if _domain_index is None:
+            # A relative path is read from the working directory; the bundled default is found next to main.py.
+            bundled = os.path.join(os.path.dirname(os.path.abspath(__file__)), "domain_authority.json")
+            path = os.getenv("DOMAIN_AUTHORITY_FILE", bundled)
+            if not os.path.exists(path) and os.path.basename(os.path.normpath(path)) == "domain_authority.json":
+                path = bundled
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            _domain_index = DomainAuthorityIndex(data["tiers"], float(data.get("default", 0.3)))
+            logger.info(f"Loaded domain authority index from {path} ({len(_domain_index.hosts)} hosts, {sum(map(len, _domain_index.paths.values()))} path rules).")
+        return _domain_index
+
+@lru_cache(maxsize=65536)
+def get_domain_score(url: str) -> float:
+    return get_domain_index().score(url)
+
+# --- Local Pre-Ranking ---
+def tokenize_terms(text: str) -> List[str]:
+    return re.findall(r"\w[\w.+#-]*\w|\w", text.lower())
+
+class BM25Index:
+    """Sparse BM25 index over a fixed list of documents, with postings stored as token-sorted NumPy arrays."""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        import numpy as np
+        tokenized = [tokenize_terms(document) for document in documents]
+        lengths = np.array([len(tokens) for tokens in tokenized], dtype=np.int64)
+        average_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        self.size = len(documents)
+        self.vocabulary: Dict[str, int] = {}
+        token_ids = np.fromiter((self.vocabulary.setdefault(token, len(self.vocabulary)) for tokens in tokenized for token in tokens),
+                                dtype=np.int64, count=int(lengths.sum()))
+        pairs, counts = np.unique(token_ids * max(self.size, 1) + np.repeat(np.arange(self.size), lengths), return_counts=True)
+        terms = pairs // max(self.size, 1)
+        self.doc_ids = pairs % max(self.size, 1)
+        self.bounds = np.searchsorted(terms, np.arange(len(self.vocabulary) + 1))
+        document_frequency = np.diff(self.bounds)[terms]
+        idf = np.log(1 + (self.size - document_frequency + 0.5) / (document_frequency + 0.5))
+        self.weights = (idf * counts * (k1 + 1) / (counts + k1 * (1 - b + b * lengths[self.doc_ids] / average_length))).astype(np.float32)
+
+    def scores(self, query: str) -> "np.ndarray":
+        import numpy as np
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize_terms(query)):
+            term = self.vocabulary.get(token)
+            if term is not None:
+                start, end = self.bounds[term], self.bounds[term + 1]
+                scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+def prefilter_sources(sources: List[Dict], stages: List[str], technologies: List[str], top_k: int) -> Dict[str, set]:
+    """Returns the ids of the top_k sources per stage by BM25 similarity of title+snippet to the stage."""
+    import numpy as np
+    index = BM25Index([f"{s.get('title', '')} {s.get('description', '')}" for s in sources])
+    candidates = {}
+    for stage in stages:
+        scores = index.scores(f"{stage} {' '.join(technologies)}")
+        candidates[stage] = {sources[i]['id'] for i in np.argsort(-scores, kind='stable')[:top_k]}
+    return candidates
+
+_relevance_cache = None
+_relevance_lock = threading.Lock()
+
+def get_relevance_cache() -> Optional[DiskCache]:
+    """Per (source, stage, technologies) LLM relevance evaluations, reusable however sources are batched."""
+    global _relevance_cache
+    if os.getenv("LLM_CACHE", "true").lower() != "true":
+        return None
+    with _relevance_lock:
+        if _relevance_cache is None:
+            _relevance_cache = DiskCache("relevance", max_bytes=50_000_000, ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "604800")))
+        return _relevance_cache
+
+def relevance_cache_key(model: str, source: Dict, stage: str, technologies: List[str]) -> str:
+    identity = [model, canonicalize_url(source['url']), source.get('title'), source.get('description'), stage.lower(), sorted(t.lower() for t in technologies)]
+    return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+
+# --- Source Ranking ---
+def get_recency_score(source: Dict, runtime_date: datetime) -> float:
+    if 'page_age' in source:
+        page_age_str = source['page_age']
+        try:
+            page_date = datetime.fromisoformat(page_age_str.replace('Z', '+00:00'))
+            if (runtime_date - page_date).days <= 365:
+                return 1.0
+            else:
+                return 0.3
+        except (ValueError, TypeError):
+            return 0.6
+    return 0.6
+
+def final_score(source: Dict, llm_eval: Optional[Dict], runtime_date: datetime) -> Optional[float]:
+    """Combines domain authority, LLM relevance and recency; None if the LLM relevance is below 0.5."""
+    if not llm_eval or llm_eval.get('relevance_score', 0) < 0.5:
+        return None
+    domain_score = get_domain_score(source['url'])
+    recency_score = get_recency_score(source, runtime_date)
+    return (domain_score * 0.5) + (llm_eval['relevance_score'] * 0.3) + (recency_score * 0.2)
+
+def score_sources(sources: List[Dict], eval_map: Dict[int, Dict], runtime_date: datetime, allowed_ids: Optional[set] = None) -> List[Dict]:
+    """Returns the top 10 sources with an LLM relevance of at least 0.5 by final score."""
+    stage_scored_sources = []
+    for source in sources:
+        llm_eval = eval_map.get(source['id'])
+        if allowed_ids is not None and source['id'] not in allowed_ids:
+            continue
+        score = final_score(source, llm_eval, runtime_date)
+        if score is None:
+            continue
+
+        stage_scored_sources.append({
+            "url": source['url'],
+            "title": source.get('title'),
+            "final_score": score,
+            "discussed_technologies": llm_eval.get('discussed_technologies', []),
+            **source
+        })
+
+    stage_scored_sources.sort(key=lambda x: x['final_score'], reverse=True)
+    return stage_scored_sources[:10] # Keep top 10 sources per stage
+
+class SourceRanker:
+    """Scores batches of sources against a group of stages with the flash model, reading and filling the relevance cache."""
+
+    def __init__(self, technologies: List[str], research_stages: List[str]):
+        self.technologies = technologies
+        self.ranking_mode = os.getenv("RANKING_MODE", "multi_stage")
+        if self.ranking_mode == "multi_stage":
+            group_size = int(os.getenv("RANKING_MAX_STAGES_PER_PROMPT", "8"))
+            self.stage_groups = [research_stages[i:i + group_size] for i in range(0, len(research_stages), group_size)]
+        else:
+            self.stage_groups = [[stage] for stage in research_stages]
+        self.llm = get_llm("flash")
+        self.relevance_cache = get_relevance_cache()
+        self.cache_keys: Dict[Tuple[int, str], str] = {}
+
+    def cache_key(self, source: Dict, stage: str) -> str:
+        if (source['id'], stage) not in self.cache_keys:
+            self.cache_keys[source['id'], stage] = relevance_cache_key(self.llm.model_name, source, stage, self.technologies)
+        return self.cache_keys[source['id'], stage]
+
+    def token_count(self, source: Dict, stage_group: List[str]) -> int:
+        """Prompt tokens for the source plus the output tokens its scores take."""
+        per_source_output = RANKING_OUTPUT_TOKENS_PER_STAGE * len(stage_group) if self.ranking_mode == "multi_stage" else 0
+        return source['token_count'] + per_source_output
+
+    def cached(self, source: Dict, stage_group: List[str]) -> Optional[Dict[str, Dict]]:
+        """Returns the cached evaluation of source for every stage in the group, or None unless all are cached."""
+        if self.relevance_cache is None:
+            return None
+        hits = {stage: self.relevance_cache.get(self.cache_key(source, stage)) for stage in stage_group}
+        if any(hit is None for hit in hits.values()):
+            return None
+        return {stage: json.loads(hit) for stage, hit in hits.items()}
+
+    def rank_batch(self, batch: List[Dict], stage_group: List[str]) -> Dict[str, Dict[int, Dict]]:
+        """Returns {stage: {source id: evaluation}} for one LLM call, empty if the response cannot be parsed."""
+        from langchain_core.output_parsers import JsonOutputParser
+        prompt_batch = [{"id": s["id"], "title": s.get("title"), "snippet": s.get("description")} for s in batch]
+        if self.ranking_mode == "multi_stage":
+            prompt = PROMPT_RANK_SOURCES_MULTI_STAGE.format(
+                stage_names=json.dumps(stage_group),
+                technologies=json.dumps(self.technologies),
+                batch_of_sources=json.dumps(prompt_batch)
+            )
+        else:
+            prompt = PROMPT_RANK_SOURCES.format(
+                stage_name=stage_group[0],
+                technologies=json.dumps(self.technologies),
+                batch_of_sources=json.dumps(prompt_batch)
+            )
+        response = self.llm.invoke(prompt, cache="none")
+        parser = JsonOutputParser()
+        try:
+            parsed_response = parser.parse(response.content)
+        except Exception as e:
+            logger.error(f"Error parsing LLM response for a batch of {len(batch)} sources in stages {stage_group}: {e}")
+            return {}
+        batch_by_id = {source['id']: source for source in batch}
+        evals_by_stage = {stage: {} for stage in stage_group}
+        cache_entries = []
+        missing_scores = 0
+        for item in parsed_response:
+            if self.ranking_mode != "multi_stage":
+                evaluations = {stage_group[0]: {
+                    "discussed_technologies": item.get('discussed_technologies', []),
+                    "relevance_score": float(item.get('relevance_score', 0) or 0)
+                }}
+            else:
+                # A stage the model left out is not evaluated, rather than scored 0.0 and cached as irrelevant.
+                scores = {str(k).lower(): v for k, v in (item.get('relevance_scores') or {}).items()}
+                evaluations = {stage: {
+                    "discussed_technologies": item.get('discussed_technologies', []),
+                    "relevance_score": float(scores[stage.lower()])
+                } for stage in stage_group if scores.get(stage.lower()) is not None}
+                missing_scores += len(stage_group) - len(evaluations)
+            for stage, evaluation in evaluations.items():
+                evals_by_stage[stage][item['id']] = evaluation
+                if item['id'] in batch_by_id:
+                    cache_entries.append((self.cache_key(batch_by_id[item['id']], stage), json.dumps(evaluation)))
+        if missing_scores:
+            logger.warning(f"Ranking response for stages {stage_group} left {missing_scores} source-stage scores out; they stay unevaluated.")
+        if self.relevance_cache is not None:
+            self.relevance_cache.set_many(cache_entries)
+        return evals_by_stage
+
+# --- Context Assembly ---
+CONTEXT_SOURCE_SCORE_WEIGHT = 0.3
+
+def format_context(chunks: List[Dict]) -> str:
+    return "\n\n---\n\n".join(f"Source: {chunk['metadata']['source_url']}\nContent: {chunk['document']}" for chunk in chunks)
+
+def assemble_context(query_embedding: List[float], chunks: List[Dict], source_scores: Dict[str, float], token_budget: int) -> List[Dict]:
+    """Greedily selects chunks by MMR over retrieval similarity and source score until the token budget is spent."""
+    if not chunks:
+        return []
+    import numpy as np
+    matrix = np.asarray([chunk['embedding'] for chunk in chunks], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= np.linalg.norm(query) + 1e-12
+    source_weight = np.array([source_scores.get(chunk['metadata'].get('source_url'), 0.0) for chunk in chunks], dtype=np.float32)
+    relevance = (1 - CONTEXT_SOURCE_SCORE_WEIGHT) * (matrix @ query) + CONTEXT_SOURCE_SCORE_WEIGHT * source_weight
+    mmr_lambda = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    tokenizer = get_tokenizer()
+
+    selected = []
+    used_tokens = 0
+    available = np.ones(len(chunks), dtype=bool)
+    redundancy = np.zeros(len(chunks), dtype=np.float32)
+    while available.any():
+        mmr = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(mmr))
+        available[best] = False
+        chunk = chunks[best]
+        tokens = len(tokenizer.encode(f"Source: {chunk['metadata']['source_url']}\nContent: {chunk['document']}"))
+        if used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        selected.append(chunk)
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+    logger.info(f"Assembled context of {used_tokens}/{token_budget} tokens from {len(selected)} chunks.")
+    return selected
+
+# --- Retrieval Index ---
+RETRIEVAL_TOP_K = 15
+RRF_K = 60
+
+def rank_rows(scores: "np.ndarray") -> "np.ndarray":
+    """Returns the 0-based rank of every column within its row, best score first."""
+    import numpy as np
+    return np.argsort(np.argsort(-scores, axis=1, kind='stable'), axis=1)
+
+class RetrievalIndex:
+    """In-memory hybrid index over one run's chunks, built once from the vector store.
+
+    Holds a contiguous, normalized float32 embedding matrix for batched cosine search and BM25 postings for exact
+    terms such as version numbers and API names, fused by reciprocal rank, plus the chunk rows of each stage's sources.
+    """
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings, stage_urls: Dict[str, List[str]]):
+        import numpy as np
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        embeddings = np.asarray(embeddings if embeddings is not None else [], dtype=np.float32)
+        self.matrix = np.ascontiguousarray(embeddings.reshape(len(self.ids), -1) if self.ids else np.zeros((0, 0), dtype=np.float32))
+        self.matrix /= np.linalg.norm(self.matrix, axis=1, keepdims=True) + 1e-12
+        self.bm25 = BM25Index(self.documents)
+        self.rows_by_url: Dict[str, List[int]] = {}
+        for row, metadata in enumerate(self.metadatas):
+            self.rows_by_url.setdefault(metadata.get('source_url'), []).append(row)
+        self.stage_rows = {stage: [row for url in urls for row in self.rows_by_url.get(url, [])] for stage, urls in stage_urls.items()}
+
+    @classmethod
+    def from_collection(cls, collection: "chromadb.Collection", urls: List[str], ranked_sources: Dict[str, List[Dict]],
+                        content_hashes: Optional[Dict[str, str]] = None) -> "RetrievalIndex":
+        """Loads every stored chunk of urls in one call, limited to the content versions this run stored if given."""
+        stored = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        if urls:
+            where = {"source_url": {"$in": urls}}
+            if content_hashes:
+                where = {"$and": [where, {"content_hash": {"$in": list(set(content_hashes[url] for url in urls if url in content_hashes))}}]}
+            stored = collection.get(where=where, include=["documents", "metadatas", "embeddings"])
+        stage_urls = {stage: list(dict.fromkeys(source['url'] for source in sources)) for stage, sources in ranked_sources.items()}
+        index = cls(stored['ids'], stored['documents'], stored['metadatas'], stored['embeddings'], stage_urls)
+        logger.info(f"Built retrieval index over {len(index.ids)} chunks from {len(index.rows_by_url)} sources.")
+        return index
+
+    def chunk(self, row: int) -> Dict:
+        return {"id": self.ids[row], "document": self.documents[row], "metadata": self.metadatas[row], "embedding": self.matrix[row]}
+
+    def search(self, query_embeddings: List[List[float]], queries: List[str], k: int = RETRIEVAL_TOP_K) -> List[List[int]]:
+        """Returns the rows of the k best chunks for every query, scoring all queries with one matrix multiply."""
+        import numpy as np
+        if not self.ids or not queries:
+            return [[] for _ in queries]
+        query_matrix = np.asarray(query_embeddings, dtype=np.float32)
+        query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True) + 1e-12
+        dense = query_matrix @ self.matrix.T
+        lexical = np.stack([self.bm25.scores(query) for query in queries])
+        fused = 1 / (RRF_K + 1 + rank_rows(dense)) + np.where(lexical > 0, 1 / (RRF_K + 1 + rank_rows(lexical)), 0)
+        return np.argsort(-fused, axis=1, kind='stable')[:, :k].tolist()
+
+# --- Report Output ---
+_token_sink: contextvars.ContextVar = contextvars.ContextVar("token_sink", default=None)
+
+class StreamPrinter:
+    """Token sink that prints one section live at a time and buffers concurrent sections until they can be printed."""
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.live: Optional[str] = None
+        self.buffers: Dict[str, List[str]] = {}
+        self.finished: List[str] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, section: str, text: str, done: bool = False) -> None:
+        with self.lock:
+            if self.live is None:
+                self._start(section)
+            if section == self.live:
+                self.out.write(text)
+            else:
+                self.buffers.setdefault(section, []).append(text)
+            if done and section == self.live:
+                self.out.write("\n\n")
+                self.live = None
+                self._advance()
+            elif done:
+                self.finished.append(section)
+            self.out.flush()
+
+    def _start(self, section: str) -> None:
+        self.live = section
+        self.out.write(f"## {section}\n\n" + "".join(self.buffers.pop(section, [])))
+
+    def _advance(self) -> None:
+        while self.finished:
+            self._start(self.finished.pop(0))
+            self.out.write("\n\n")
+            self.live = None
+        if self.buffers:
+            self._start(next(iter(self.buffers)))
+
+def emit_tokens(section: str, text: str, done: bool = False) -> None:
+    """Forwards streamed text for a report section to the sink set by the caller, if any."""
+    sink = _token_sink.get()
+    if sink is not None and (text or done):
+        sink(section, text, done)
+
+def report_file_name(technologies: List[str], runtime_date: datetime) -> str:
+    return f"report_{'_vs_'.join(t.lower().replace(' ', '_') for t in technologies)}_{runtime_date.strftime('%Y-%m-%d')}.md"
+
+def report_header(technologies: List[str], runtime_date: datetime) -> str:
+    return f"# Technology Analysis Report: {', '.join(technologies)}\n\n*Report generated on: {runtime_date.strftime('%Y-%m-%d %H:%M:%S')}*\n\n"
+
+def append_partial_report(technologies: List[str], runtime_date: datetime, text: str, start: bool = False) -> None:
+    """Appends finished output to <report>.partial so a crash late in the run keeps every completed section."""
+    with open(f"{report_file_name(technologies, runtime_date)}.partial", "w" if start else "a", encoding='utf-8') as f:
+        f.write(text)
+
+def write_partial_report(technologies: List[str], runtime_date: datetime, text: str) -> None:
+    """Replaces <report>.partial atomically, so a crash mid-write never loses sections written before."""
+    partial_path = f"{report_file_name(technologies, runtime_date)}.partial"
+    with open(f"{partial_path}.tmp", "w", encoding='utf-8') as f:
+        f.write(text)
+    os.replace(f"{partial_path}.tmp", partial_path)
+
+def manifest_file_name(technologies: List[str]) -> str:
+    """The refresh manifest is keyed by technology set only, so every dated report of the set shares it."""
+    return f"report_{'_vs_'.join(t.lower().replace(' ', '_') for t in technologies)}.manifest.json"
+
+def load_manifest(technologies: List[str]) -> Optional[Dict]:
+    try:
+        with open(manifest_file_name(technologies), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable report manifest {manifest_file_name(technologies)}: {e}")
+        return None
+
+def save_manifest(technologies: List[str], manifest: Dict) -> None:
+    file_name = manifest_file_name(technologies)
+    with open(f"{file_name}.tmp", "w", encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{file_name}.tmp", file_name)
+
+def prompt_hash(model_name: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model_name}\n{prompt}".encode('utf-8')).hexdigest()
+
+def describe_evidence_change(previous: Dict, current: Dict) -> str:
+    added = len(set(current['sources']) - set(previous.get('sources', [])))
+    removed = len(set(previous.get('sources', [])) - set(current['sources']))
+    changed_chunks = len(set(current['chunks']) ^ set(previous.get('chunks', [])))
+    return f"+{added}/-{removed} sources, {changed_chunks} chunks added or removed"
 
 # --- Graph Nodes ---
+def parse_plan(content: str, queries_per_stage: int) -> Dict:
+    """Validates a PROMPT_PLAN_REPORT response. Raises ValueError if it does not match the schema."""
+    from langchain_core.output_parsers import JsonOutputParser
+    try:
+        plan = JsonOutputParser().parse(content)
+    except Exception as e:
+        raise ValueError(f"plan is not valid JSON: {str(e).splitlines()[0]}")
+    if not isinstance(plan, dict) or not isinstance(plan.get("is_comparable"), bool):
+        raise ValueError("plan is missing a boolean 'is_comparable'")
+    if not plan["is_comparable"]:
+        return {"is_comparable": False}
+    stages = plan.get("report_stages")
+    if not isinstance(stages, list) or not stages or not all(isinstance(stage, str) and stage.strip() for stage in stages):
+        raise ValueError("plan is missing a non-empty 'report_stages' list of titles")
+    queries = plan.get("search_queries")
+    if not isinstance(queries, dict):
+        raise ValueError("plan is missing a 'search_queries' object")
+    queries = {str(stage).lower(): stage_queries for stage, stage_queries in queries.items()}
+    search_queries = []
+    for stage in stages:
+        if stage.lower() in NON_RESEARCH_STAGES:
+            continue
+        stage_queries = queries.get(stage.lower())
+        if not isinstance(stage_queries, list) or not any(isinstance(q, str) and q.strip() for q in stage_queries):
+            raise ValueError(f"plan has no search queries for section '{stage}'")
+        search_queries.extend(q.strip() for q in stage_queries[:queries_per_stage] if isinstance(q, str) and q.strip())
+    return {"is_comparable": True, "report_stages": stages, "search_queries": list(dict.fromkeys(search_queries))}
+
+def plan_report(state: ResearchState) -> Optional[Dict]:
+    """Plans comparability, stages and search queries in one LLM call. Returns None if the response is unusable."""
+    queries_per_stage = int(os.getenv("PLANNING_QUERIES_PER_STAGE", "2"))
+    prompt = PROMPT_PLAN_REPORT.format(
+        technologies=", ".join(state['technologies']),
+        report_mode=state['report_mode'],
+        year=state['runtime_date'].year,
+        queries_per_stage=queries_per_stage
+    )
+    llm = get_llm("flash")
+    response = llm.invoke(prompt, cache="semantic", semantic_key=semantic_cache_key(
+        PROMPT_PLAN_REPORT, ", ".join(state['technologies']), report_mode=state['report_mode'],
+        year=state['runtime_date'].year, queries_per_stage=queries_per_stage))
+    try:
+        plan = parse_plan(response.content, queries_per_stage)
+    except ValueError as e:
+        llm.forget(prompt)
+        logger.warning(f"Single-call planning failed ({e}). Falling back to per-step planning.")
+        return None
+    if not plan['is_comparable'] and state['report_mode'] != "comparison":
+        logger.warning("Single-call planning rejected a single-technology report. Falling back to per-step planning.")
+        return None
+    return plan
+
 def define_report_stages(state: ResearchState) -> ResearchState:
     logger.info("🚀 ---NODE: DEFINING REPORT STAGES---")
+    from langchain_core.exceptions import OutputParserException
+    from langchain_core.output_parsers import JsonOutputParser
     technologies = state['technologies']
     logger.info(f"Technologies to research: {technologies}")
     report_mode = "comparison" if len(technologies) > 1 else "single"
@@ -178,13 +1412,35 @@ def define_report_stages(state: ResearchState) -> ResearchState:
     state['runtime_date'] = datetime.now()
     logger.info(f"Report mode set to: {report_mode}")
 
+    state['search_queries'] = None
+    if os.getenv("PLANNING_MODE", "single_call") == "single_call":
+        logger.info("Planning comparability, stages and search queries in one call.")
+        plan = plan_report(state)
+        if plan is not None:
+            state['is_comparable'] = plan['is_comparable']
+            if not plan['is_comparable']:
+                logger.warning("Technologies not comparable. Ending workflow.")
+                return state
+            state['report_stages'] = plan['report_stages']
+            state['search_queries'] = plan['search_queries']
+            logger.info(f"Planned stages {plan['report_stages']} with {len(plan['search_queries'])} search queries.")
+            return state
+
     if report_mode == "comparison":
         logger.info("Validating comparability of technologies.")
         llm = get_llm("flash")
         prompt = PROMPT_VALIDATE_COMPARISON.format(technologies=technologies)
-        response = llm.invoke(prompt)
+        response = llm.invoke(prompt, cache="semantic", semantic_key=semantic_cache_key(PROMPT_VALIDATE_COMPARISON, ", ".join(technologies)))
         parser = JsonOutputParser()
-        is_comparable = parser.parse(response.content).get("is_comparable", False)
+        try:
+            verdict = parser.parse(response.content)
+            if not isinstance(verdict, dict):
+                raise OutputParserException(f"expected a JSON object, got {type(verdict).__name__}")
+        except OutputParserException:
+            llm.forget(prompt)
+            logger.error(f"Failed to parse comparability from LLM. Raw content: {response.content}")
+            raise
+        is_comparable = verdict.get("is_comparable", False)
         state['is_comparable'] = is_comparable
         logger.info(f"Are technologies comparable? {'Yes' if is_comparable else 'No'}")
         if not is_comparable:
@@ -199,11 +1455,14 @@ def define_report_stages(state: ResearchState) -> ResearchState:
         technologies=", ".join(technologies),
         report_mode=report_mode
     )
-    response = llm.invoke(prompt)
+    response = llm.invoke(prompt, cache="semantic", semantic_key=semantic_cache_key(PROMPT_DEFINE_STAGES, ", ".join(technologies), report_mode=report_mode))
     parser = JsonOutputParser()
     try:
         report_stages = parser.parse(response.content)
-    except json.JSONDecodeError:
+        if not isinstance(report_stages, list) or not report_stages or not all(isinstance(stage, str) for stage in report_stages):
+            raise OutputParserException("expected a non-empty JSON array of section titles")
+    except OutputParserException:
+        llm.forget(prompt)
         logger.error(f"Failed to parse report stages from LLM. Raw content: {response.content}")
         report_stages = ["Introduction", "Performance", "Scalability", "Developer Experience", "Security", "Ecosystem", "Conclusion"]
     state['report_stages'] = report_stages
@@ -212,6 +1471,9 @@ def define_report_stages(state: ResearchState) -> ResearchState:
 
 def generate_search_queries(state: ResearchState) -> ResearchState:
     logger.info("🔍 ---NODE: GENERATING SEARCH QUERIES---")
+    if state.get('search_queries'):
+        logger.info(f"Using {len(state['search_queries'])} search queries from the planning call.")
+        return state
     llm = get_llm("flash")
     technologies = state['technologies']
     report_stages = state['report_stages']
@@ -220,14 +1482,15 @@ def generate_search_queries(state: ResearchState) -> ResearchState:
     tech_string = " vs ".join(technologies)
     
     for stage in report_stages:
-        if stage.lower() in ["introduction", "conclusion", "final assessment"]:
+        if stage.lower() in NON_RESEARCH_STAGES:
             continue
         prompt = PROMPT_GENERATE_QUERIES.format(
             technologies=tech_string,
             stage_name=stage,
             year=state['runtime_date'].year
         )
-        response = llm.invoke(prompt)
+        response = llm.invoke(prompt, cache="semantic", semantic_key=semantic_cache_key(
+            PROMPT_GENERATE_QUERIES, tech_string, stage_name=stage, year=state['runtime_date'].year))
         search_queries.append(response.content.strip())
 
     state['search_queries'] = list(set(search_queries)) # Remove duplicates
@@ -237,46 +1500,22 @@ def generate_search_queries(state: ResearchState) -> ResearchState:
 def execute_web_search(state: ResearchState) -> ResearchState:
     logger.info("🌐 ---NODE: EXECUTING WEB SEARCH---")
     search_queries = state['search_queries']
-    brave_api_key = os.getenv("BRAVE_API_KEY")
-    if not brave_api_key:
-        logger.error("BRAVE_API_KEY environment variable not set.")
-        raise ValueError("BRAVE_API_KEY environment variable not set.")
+    max_workers = int(os.getenv("BRAVE_MAX_CONCURRENCY", "4"))
+    session, headers = open_search_session(max_workers)
 
     all_results = []
-    session = requests.Session()
-    headers = {
-        "X-Subscription-Token": brave_api_key,
-        "Accept": "application/json"
-    }
-
-    for query in search_queries:
-        logger.info(f"Executing search for query: '{query}'")
-        try:
-            response = session.get(
-                "https://api.search.brave.com/res/v1/web/search",
-                headers=headers,
-                params={"q": query, "count": 10, "text_decorations": False},
-                timeout=15
-            )
-            response.raise_for_status()
-            results = response.json().get("web", {}).get("results", [])
-            logger.info(f"Found {len(results)} results for query.")
+    latencies = []
+    total_retries = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [submit_in_context(executor, run_search_query, session, headers, query) for query in search_queries]
+        for results, latency, retries in (future.result() for future in futures):
             all_results.extend(results)
-        except requests.exceptions.Timeout:
-            logger.warning(f"Search query '{query}' timed out.")
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"HTTP error for query '{query}': {e}")
-            if 400 <= e.response.status_code < 500:
-                logger.critical("Critical API key or request error. Please check your BRAVE_API_KEY.")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"An unexpected error occurred for query '{query}': {e}")
-        finally:
-            time.sleep(1)
+            total_retries += retries
+            if latency is not None:
+                latencies.append(latency)
+    log_search_metrics(latencies, total_retries, len(search_queries))
 
-    unique_urls = {result['url'] for result in all_results}
-    unique_sources = [next(s for s in all_results if s['url'] == url) for url in unique_urls]
-    
-    state['raw_sources'] = list(unique_sources)
+    state['raw_sources'] = deduplicate_sources(all_results)
     logger.info(f"Found {len(state['raw_sources'])} unique sources across all queries.")
     return state
 
@@ -287,60 +1526,54 @@ def rank_and_filter_sources(state: ResearchState) -> ResearchState:
         state['ranked_sources'] = {}
         return state
 
-    def get_domain_score(url: str) -> float:
-        domain_keywords = {
-            "1.0": ["nextjs.org", "remix.run", "react.dev", "vuejs.org", "angular.io", "svelte.dev", "solidjs.com", "qwik.builder.io", "astro.build", "deno.land", "nodejs.org", "python.org", "docs.microsoft.com", "developer.mozilla.org", "w3.org", "ecma-international.org", "graphql.org", "restfulapi.net", "kubernetes.io", "docker.com", "cloud.google.com", "aws.amazon.com", "azure.microsoft.com", "spring.io", "golang.org", "rust-lang.org", "llvm.org", "kernel.org", "apache.org", "eclipse.org", "ietf.org", "iso.org", "nist.gov", "mit.edu", "stanford.edu", "berkeley.edu", "cmu.edu", "ieee.org", "acm.org", "arxiv.org", "dl.acm.org", "jstor.org", "sciencedirect.com", "link.springer.com", "wiley.com", "taylorandfrancis.com", "elsevier.com"],
-            "0.9": ["vercel.com/blog", "engineering.fb.com", "aws.amazon.com/blogs", "netflixtechblog", "google.dev", "microsoft.com/research", "redhat.com/en/blog", "ibm.com/blogs", "developer.apple.com", "android.com/developers", "stripe.com/blog", "shopify.dev", "salesforce.com/news"],
-            "0.8": ["smashingmagazine.com", "css-tricks.com", "infoq.com", "thenewstack.io", "martinfowler.com", "oreilly.com", "apress.com", "manning.com", "techcrunch.com", "wired.com", "zdnet.com", "infoworld.com", "computerworld.com", "arstechnica.com"],
-            "0.7": ["dev.to", "freecodecamp.org", "logrocket.com", "toptal.com/developers", "hackernoon.com", "towardsdatascience.com", "betterprogramming.pub", "medium.com", "hashnode.dev", "devdojo.com"],
-            "0.6": ["stackoverflow.com", "reddit.com/r/programming", "quora.com", "stackexchange.com"],
-            "0.5": ["github.com", "gitlab.com", "bitbucket.org", "gitee.com"]
-        }
-        domain = urlparse(url).netloc
-        for score, keywords in domain_keywords.items():
-            if any(keyword in domain for keyword in keywords):
-                return float(score)
-        return 0.3
-
-    def get_recency_score(source: Dict, runtime_date: datetime) -> float:
-        if 'page_age' in source:
-            page_age_str = source['page_age']
-            try:
-                page_date = datetime.fromisoformat(page_age_str.replace('Z', '+00:00'))
-                if (runtime_date - page_date).days <= 365:
-                    return 1.0
-                else:
-                    return 0.3
-            except (ValueError, TypeError):
-                return 0.6
-        return 0.6
-
     raw_sources = state['raw_sources']
     runtime_date = state['runtime_date']
     technologies = state['technologies']
     report_stages = state['report_stages']
     
-    tokenizer = tiktoken.get_encoding("cl100k_base")
+    tokenizer = get_tokenizer()
     
     for i, source in enumerate(raw_sources):
         source['id'] = i
+        if 'token_count' not in source:
+            source['token_count'] = len(tokenizer.encode(f"Title: {source.get('title', '')}\nSnippet: {source.get('description', '')}"))
 
     ranked_sources_by_stage = {stage: [] for stage in report_stages}
-    llm = get_llm("flash")
-
-    for stage in report_stages:
-        if stage.lower() in ["introduction", "conclusion", "final assessment"]:
-            continue
-
-        logger.info(f"Ranking sources for stage: '{stage}'")
-        
+    research_stages = [stage for stage in report_stages if stage.lower() not in NON_RESEARCH_STAGES]
+    ranker = SourceRanker(technologies, research_stages)
+    logger.info(f"Ranking {len(raw_sources)} sources in '{ranker.ranking_mode}' mode across {len(ranker.stage_groups)} stage group(s).")
+
+    top_k = int(os.getenv("RANKING_PREFILTER_TOP_K", "25"))
+    evaluate_prefilter = os.getenv("RANKING_PREFILTER_EVAL", "false").lower() == "true"
+    candidates_by_stage = None
+    if 0 < top_k < len(raw_sources):
+        candidates_by_stage = prefilter_sources(raw_sources, research_stages, technologies, top_k)
+        logger.info(f"Local pre-filter kept the top {top_k} of {len(raw_sources)} sources per stage.")
+
+    evals_by_stage = {stage: {} for stage in research_stages}
+    llm_calls = 0
+    cached_evaluations = 0
+
+    for stage_group in ranker.stage_groups:
+        group_sources = raw_sources
+        if candidates_by_stage and not evaluate_prefilter:
+            group_ids = set().union(*(candidates_by_stage[stage] for stage in stage_group))
+            group_sources = [source for source in raw_sources if source['id'] in group_ids]
+        uncached_sources = []
+        for source in group_sources:
+            hits = ranker.cached(source, stage_group)
+            if hits is None:
+                uncached_sources.append(source)
+                continue
+            for stage, hit in hits.items():
+                evals_by_stage[stage][source['id']] = hit
+            cached_evaluations += 1
         batches = []
         current_batch = []
         current_token_count = 0
-        for source in raw_sources:
-            content_to_tokenize = f"Title: {source.get('title', '')}\nSnippet: {source.get('description', '')}"
-            token_count = len(tokenizer.encode(content_to_tokenize))
-            if current_token_count + token_count > RANKING_TOKEN_LIMIT:
+        for source in uncached_sources:
+            token_count = ranker.token_count(source, stage_group)
+            if current_batch and current_token_count + token_count > RANKING_TOKEN_LIMIT:
                 batches.append(current_batch)
                 current_batch = []
                 current_token_count = 0
@@ -349,128 +1582,646 @@ def rank_and_filter_sources(state: ResearchState) -> ResearchState:
         if current_batch:
             batches.append(current_batch)
 
-        all_llm_evals = []
         for i, batch in enumerate(batches):
-            logger.info(f"Processing batch {i+1}/{len(batches)} for stage '{stage}'...")
-            prompt_batch = [{"id": s["id"], "title": s.get("title"), "snippet": s.get("description")} for s in batch]
-            prompt = PROMPT_RANK_SOURCES.format(
-                stage_name=stage,
-                technologies=json.dumps(technologies),
-                batch_of_sources=json.dumps(prompt_batch)
-            )
-            response = llm.invoke(prompt)
-            parser = JsonOutputParser()
-            try:
-                parsed_response = parser.parse(response.content)
-                all_llm_evals.extend(parsed_response)
-            except Exception as e:
-                logger.error(f"Error parsing LLM response for batch {i+1} in stage '{stage}': {e}")
-
-        eval_map = {item['id']: item for item in all_llm_evals}
-        
-        stage_scored_sources = []
-        for source in raw_sources:
-            llm_eval = eval_map.get(source['id'])
-            if not llm_eval or llm_eval.get('relevance_score', 0) < 0.5:
-                continue
-
-            domain_score = get_domain_score(source['url'])
-            recency_score = get_recency_score(source, runtime_date)
-            final_score = (domain_score * 0.5) + (llm_eval['relevance_score'] * 0.3) + (recency_score * 0.2)
-            
-            stage_scored_sources.append({
-                "url": source['url'],
-                "title": source.get('title'),
-                "final_score": final_score,
-                "discussed_technologies": llm_eval.get('discussed_technologies', []),
-                **source
-            })
-        
-        stage_scored_sources.sort(key=lambda x: x['final_score'], reverse=True)
-        ranked_sources_by_stage[stage] = stage_scored_sources[:10] # Keep top 10 sources per stage
+            logger.info(f"Processing batch {i+1}/{len(batches)} for stages {stage_group}...")
+            for stage, evaluations in ranker.rank_batch(batch, stage_group).items():
+                evals_by_stage[stage].update(evaluations)
+            llm_calls += 1
+    logger.info(f"Ranking used {llm_calls} LLM calls for {len(research_stages)} stages; {cached_evaluations} source evaluations came from the relevance cache.")
+
+    for stage in research_stages:
+        ranked_sources_by_stage[stage] = score_sources(raw_sources, evals_by_stage[stage], runtime_date, candidates_by_stage[stage] if candidates_by_stage else None)
         logger.info(f"Found {len(ranked_sources_by_stage[stage])} relevant sources for stage '{stage}'.")
+        if candidates_by_stage and evaluate_prefilter:
+            full_urls = {s['url'] for s in score_sources(raw_sources, evals_by_stage[stage], runtime_date)}
+            kept_urls = {s['url'] for s in ranked_sources_by_stage[stage]}
+            recall = len(full_urls & kept_urls) / len(full_urls) if full_urls else 1.0
+            logger.info(f"Pre-filter recall for stage '{stage}': {recall:.2f} ({len(full_urls & kept_urls)}/{len(full_urls)} of the full LLM top 10).")
 
     state['ranked_sources'] = ranked_sources_by_stage
     logger.info("---RANKING AND FILTERING COMPLETE---")
     return state
 
-class ChromaEmbeddingFunction(chromadb.EmbeddingFunction):
-    def __init__(self, embeddings_model):
-        self.embeddings_model = embeddings_model
+# --- Embedding Service ---
+class EmbeddingService:
+    """Embeds texts in fixed-size batches through one shared client, caching vectors on disk by text hash."""
+
+    def __init__(self):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        self.model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        self.cache = DiskCache("embeddings", max_bytes=int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "200")) * 1e6))
+
+    def _embed(self, texts: List[str], task: str) -> List[List[float]]:
+        started = time.time()
+        import numpy as np
+        keys = [hashlib.sha256(f"{task}:{text}".encode('utf-8')).hexdigest() for text in texts]
+        vectors = {key: np.frombuffer(cached, dtype=np.float32).tolist() for key, cached in self.cache.get_many(keys).items()}
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+
+        missing_items = list(missing.items())
+        for i in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[i:i + self.batch_size]
+            batch_texts = [text for _, text in batch]
+            embedded = self.model.embed_documents(batch_texts) if task == "document" else self.model.embed_documents(batch_texts, task_type="RETRIEVAL_QUERY")
+            vectors.update((key, vector) for (key, _), vector in zip(batch, embedded))
+            self.cache.set_many([(key, np.asarray(vector, dtype=np.float32).tobytes()) for (key, _), vector in zip(batch, embedded)])
+        record_span(f"embedding.{task}", "embedding", started, embedding_texts=len(texts), embedded_texts=len(missing), cache_hits=len(texts) - len(missing))
+        logger.info(f"Embedded {len(texts)} {task} texts: {len(missing)} computed, {len(texts) - len(missing)} from cache or duplicates.")
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document")
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "query")
+
+def chroma_embedding_function(embedding_service: EmbeddingService):
+    """Adapts the embedding service to ChromaDB; the class is built on first use so chromadb is only imported when needed."""
+    import chromadb
+
+    class ChromaEmbeddingFunction(chromadb.EmbeddingFunction):
+        def __call__(self, input: chromadb.Documents) -> chromadb.Embeddings:
+            return embedding_service.embed_documents(input)
+
+    return ChromaEmbeddingFunction()
+
+_embedding_service = None
+_embedding_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    global _embedding_service
+    with _embedding_lock:
+        if _embedding_service is None:
+            _embedding_service = EmbeddingService()
+            logger.info(f"Created embedding service with batch size {_embedding_service.batch_size}.")
+        return _embedding_service
+
+# --- JS Rendering ---
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+class BrowserPool:
+    """Pool of reusable headless Chromium pages driven from a dedicated event loop thread.
+
+    A page that fails is closed and replaced; if no replacement can be opened or the browser has disconnected, the
+    browser is relaunched with a fresh set of pages. Pages of a previous browser are never returned to the pool.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="browser-pool", daemon=True).start()
+        self.browser = None
+        self.connected = False
+        self.generation = 0
+        self.pages: Optional[asyncio.Queue] = None
+        self.relaunch_lock: Optional[asyncio.Lock] = None
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    async def _start(self) -> None:
+        import pyppeteer
+        self.browser = await pyppeteer.launch(headless=True, args=["--no-sandbox"], handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False)
+        self.connected = True
+        browser = self.browser
+        browser.on('disconnected', lambda: self._on_disconnected(browser))
+        if self.pages is None:
+            self.pages = asyncio.Queue()
+            self.relaunch_lock = asyncio.Lock()
+        for _ in range(self.size):
+            self.pages.put_nowait(await self._new_page())
+        logger.info(f"Started headless browser pool with {self.size} pages.")
+
+    def _on_disconnected(self, browser) -> None:
+        if browser is self.browser:
+            logger.warning("Headless browser disconnected.")
+            self.connected = False
+
+    async def _relaunch(self) -> None:
+        """Replaces the browser and every pooled page; pages still in use by the old browser are dropped on return."""
+        logger.warning(f"Relaunching headless browser pool (generation {self.generation + 1}).")
+        self.generation += 1
+        old_browser, self.browser, self.connected = self.browser, None, False
+        while not self.pages.empty():
+            self.pages.get_nowait()
+        if old_browser is not None:
+            try:
+                await old_browser.close()
+            except Exception as e:
+                logger.warning(f"Failed to close the previous headless browser: {e}")
+        await self._start()
 
-    def __call__(self, input: chromadb.Documents) -> chromadb.Embeddings:
-        return self.embeddings_model.embed_documents(input)
+    async def _replace_page(self, page, generation: int) -> None:
+        try:
+            await page.close()
+        except Exception as e:
+            logger.warning(f"Failed to close a failed browser page: {e}")
+        async with self.relaunch_lock:
+            if generation != self.generation:
+                return
+            if self.connected:
+                try:
+                    self.pages.put_nowait(await self._new_page())
+                    return
+                except Exception as e:
+                    logger.warning(f"Failed to open a replacement browser page: {e}")
+            await self._relaunch()
+
+    async def _new_page(self):
+        page = await self.browser.newPage()
+        await page.setRequestInterception(True)
+        page.on('request', lambda request: asyncio.ensure_future(
+            request.abort() if request.resourceType in BLOCKED_RESOURCE_TYPES else request.continue_()
+        ))
+        return page
+
+    async def _wait_for_stable_dom(self, page, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        previous_length = -1
+        while time.monotonic() < deadline:
+            length = await page.evaluate("document.body ? document.body.innerText.length : 0")
+            if length == previous_length and length > 0:
+                return
+            previous_length = length
+            await asyncio.sleep(0.25)
+
+    async def _render(self, url: str, timeout: float) -> str:
+        if self.browser is None:
+            async with self.relaunch_lock:
+                if self.browser is None:
+                    await self._relaunch()
+        page = await asyncio.wait_for(self.pages.get(), timeout)
+        generation = self.generation
+        try:
+            await page.goto(url, waitUntil='networkidle2', timeout=int(timeout * 1000))
+            await self._wait_for_stable_dom(page, timeout=3)
+            content = await page.content()
+        except Exception:
+            await self._replace_page(page, generation)
+            raise
+        if generation == self.generation:
+            self.pages.put_nowait(page)
+        return content
+
+    def render(self, url: str, timeout: float = 25) -> str:
+        return asyncio.run_coroutine_threadsafe(self._render(url, timeout), self.loop).result(timeout + 10)
+
+    def close(self) -> None:
+        if self.browser is not None:
+            asyncio.run_coroutine_threadsafe(self.browser.close(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+_browser_pool = None
+_js_domains = None
+_render_lock = threading.Lock()
+
+def get_browser_pool() -> BrowserPool:
+    global _browser_pool
+    with _render_lock:
+        if _browser_pool is None:
+            _browser_pool = BrowserPool(int(os.getenv("JS_RENDER_CONCURRENCY", "3")))
+            atexit.register(_browser_pool.close)
+        return _browser_pool
+
+def _get_js_domains() -> DiskCache:
+    global _js_domains
+    with _render_lock:
+        if _js_domains is None:
+            _js_domains = DiskCache("js_domains", max_bytes=1_000_000, ttl_seconds=float(os.getenv("JS_DOMAIN_TTL_SECONDS", "2592000")))
+        return _js_domains
+
+def domain_needs_js(host: str) -> bool:
+    return _get_js_domains().get(host) is not None
+
+def remember_js_domain(host: str) -> None:
+    if not domain_needs_js(host):
+        _get_js_domains().set(host, "1")
+        logger.info(f"Remembering that {host} needs JS rendering.")
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+def get_vector_store() -> "chromadb.Collection":
+    """Opens the shared, persistent chunk collection. It is rebuilt on demand rather than carried in graph state."""
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            db_path = os.getenv("CHROMA_DB_PATH", "./chroma_db")
+            collection_name = os.getenv("CHROMA_COLLECTION_NAME", "report")
+            logger.info(f"Opening ChromaDB collection '{collection_name}' at {db_path}.")
+            import chromadb
+            chroma_client = chromadb.PersistentClient(path=db_path)
+            _vector_store = chroma_client.get_or_create_collection(name=collection_name, embedding_function=chroma_embedding_function(get_embedding_service()))
+        return _vector_store
+
+# --- Crawl Service ---
+_http_session = None
+_page_cache = None
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_crawl_lock = threading.Lock()
+
+def get_http_session() -> "requests.Session":
+    global _http_session
+    with _crawl_lock:
+        if _http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            pool_size = int(os.getenv("CRAWL_MAX_WORKERS", "8"))
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=int(os.getenv("CRAWL_PER_HOST_LIMIT", "2")))
+            _http_session = requests.Session()
+            _http_session.mount("http://", adapter)
+            _http_session.mount("https://", adapter)
+            logger.info(f"Created pooled HTTP session with {pool_size} host pools.")
+        return _http_session
+
+def get_page_cache() -> DiskCache:
+    global _page_cache
+    with _crawl_lock:
+        if _page_cache is None:
+            _page_cache = DiskCache("pages", max_bytes=int(float(os.getenv("PAGE_CACHE_MAX_MB", "500")) * 1e6))
+        return _page_cache
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = urlparse(url).netloc
+    with _crawl_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(int(os.getenv("CRAWL_PER_HOST_LIMIT", "2")))
+        return _host_semaphores[host]
+
+def read_limited(response: "requests.Response", max_bytes: int) -> bytes:
+    """Reads a streamed response body, truncating it at max_bytes."""
+    body = bytearray()
+    for block in response.iter_content(chunk_size=65536):
+        body.extend(block[:max_bytes - len(body)])
+        if len(body) >= max_bytes:
+            logger.warning(f"Truncated {response.url} at the {max_bytes} byte download limit.")
+            break
+    response.close()
+    return bytes(body)
+
+def fetch_and_extract(url: str) -> Tuple[Optional[str], str, int]:
+    """Returns the extracted text of a page, how it was obtained ('hit', 'revalidated', 'miss' or 'rendered') and bytes downloaded."""
+    start = time.time()
+    cleaned_text, cache_status, downloaded = _fetch_and_extract(url)
+    record_span("http.fetch", "http", start, url=url, cache_status=cache_status, bytes=downloaded, cache_hits=int(cache_status in ("hit", "revalidated")))
+    return cleaned_text, cache_status, downloaded
+
+def _fetch_and_extract(url: str) -> Tuple[Optional[str], str, int]:
+    import trafilatura
+    page_cache = get_page_cache()
+    cached = page_cache.get(url)
+    entry = json.loads(cached) if cached else None
+    if entry and time.time() - entry['fetched_at'] < float(os.getenv("PAGE_CACHE_TTL_SECONDS", "86400")):
+        return entry['text'], "hit", 0
+
+    host = urlparse(url).netloc
+    downloaded = 0
+    if domain_needs_js(host):
+        logger.info(f"{host} is known to need JS rendering. Rendering {url} directly.")
+    else:
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        with _host_semaphore(url):
+            response = get_http_session().get(url, headers=headers, timeout=15, stream=True)
+            if entry and response.status_code == 304:
+                response.close()
+                entry['fetched_at'] = time.time()
+                page_cache.set(url, json.dumps(entry))
+                return entry['text'], "revalidated", 0
+            if not response.ok:
+                response.close()
+            response.raise_for_status()
+            body = read_limited(response, int(float(os.getenv("CRAWL_MAX_DOWNLOAD_MB", "5")) * 1e6))
+        downloaded = len(body)
+        html = body.decode(response.encoding or "utf-8", errors="replace")
+        del body
+        cleaned_text = trafilatura.extract(html)
+        if cleaned_text and len(cleaned_text) >= MIN_EXTRACTED_CHARS:
+            page_cache.set(url, json.dumps({
+                "body": html,
+                "text": cleaned_text,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched_at": time.time()
+            }))
+            return cleaned_text, "miss", downloaded
+        logger.warning(f"Initial crawl failed or content too short for {url}. Falling back to robust JS rendering.")
 
-def crawl_and_build_rag_store(state: ResearchState) -> ResearchState:
+    try:
+        html = get_browser_pool().render(url)
+    except Exception as e:
+        logger.error(f"Robust JS rendering failed for {url}: {e}")
+        return None, "rendered", downloaded
+    cleaned_text = trafilatura.extract(html)
+    if cleaned_text and len(cleaned_text) >= MIN_EXTRACTED_CHARS:
+        remember_js_domain(host)
+    page_cache.set(url, json.dumps({"body": html, "text": cleaned_text, "etag": None, "last_modified": None, "fetched_at": time.time()}))
+    return cleaned_text, "rendered", downloaded + len(html.encode('utf-8'))
+
+def crawl_sources(sources: List[Dict], cache_stats: Optional[Counter] = None, prefetched: Optional[Dict[str, Future]] = None):
+    """Fetches and extracts pages concurrently, yielding (source, text) in completion order.
+
+    URLs in prefetched reuse the fetch_and_extract futures already started for them.
+    """
+    cache_stats = cache_stats if cache_stats is not None else Counter()
+    prefetched = prefetched or {}
+    max_workers = int(os.getenv("CRAWL_MAX_WORKERS", "8"))
+    logger.info(f"Crawling {len(sources)} sources with {max_workers} workers ({len(prefetched)} already started).")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {prefetched.get(source['url']) or submit_in_context(executor, fetch_and_extract, source['url']): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                cleaned_text, cache_status, downloaded = future.result()
+                cache_stats[cache_status] += 1
+                cache_stats['bytes_fetched'] += downloaded
+            except Exception as e:
+                logger.error(f"Error crawling {source['url']}: {e}")
+                continue
+            yield source, cleaned_text
+
+def iter_chunks(text: str, text_splitter: "RecursiveCharacterTextSplitter", window_chars: int = 20000):
+    """Splits text one window at a time, breaking windows on paragraph boundaries, so only one window's chunks are held."""
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + window_chars)
+        if end < len(text):
+            boundary = text.rfind("\n", start + window_chars // 2, end)
+            end = boundary + 1 if boundary != -1 else end
+        yield from text_splitter.split_text(text[start:end])
+        start = end
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+
+# Older content versions of a page are kept this long, so a concurrent job that stored one can still retrieve it.
+STALE_CHUNK_GRACE_SECONDS = 3600
+
+def crawl_and_build_rag_store(state: ResearchState, prefetched: Optional[Dict[str, Future]] = None) -> ResearchState:
     logger.info("🧠 ---NODE: CRAWLING AND BUILDING RAG STORE---")
     ranked_sources = state['ranked_sources']
     
-    db_path = os.getenv("CHROMA_DB_PATH", "./chroma_db")
-    collection_name = os.getenv("CHROMA_COLLECTION_NAME", "report")
-    
-    logger.info(f"Initializing Google Generative AI embeddings and ChromaDB client at {db_path}.")
-    embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    embeddings = ChromaEmbeddingFunction(embeddings_model)
-    
-    chroma_client = chromadb.PersistentClient(path=db_path)
-    try:
-        chroma_client.delete_collection(name=collection_name)
-        logger.info(f"Existing ChromaDB collection '{collection_name}' deleted.")
-    except Exception as e:
-        logger.info(f"ChromaDB collection '{collection_name}' did not exist or could not be deleted: {e}")
-    vector_store = chroma_client.create_collection(name=collection_name, embedding_function=embeddings)
-    state['chroma_client'] = chroma_client
+    embedding_service = get_embedding_service()
+    vector_store = get_vector_store()
+    logger.info(f"Using shared ChromaDB collection '{vector_store.name}' with {vector_store.count()} existing chunks.")
 
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    html_session = requests_html.HTMLSession()
     
     all_sources_to_crawl = []
     for stage, sources in ranked_sources.items():
         all_sources_to_crawl.extend(sources)
         
-    unique_urls_to_crawl = {s['url']: s for s in all_sources_to_crawl}.values()
-    logger.info(f"Identified {len(unique_urls_to_crawl)} unique sources to crawl across all stages.")
-
-    for i, source in enumerate(unique_urls_to_crawl):
-        url = source['url']
-        logger.info(f"Crawling {i+1}/{len(unique_urls_to_crawl)}: {url}")
+    unique_sources_to_crawl = list({s['url']: s for s in all_sources_to_crawl}.values())
+    logger.info(f"Identified {len(unique_sources_to_crawl)} unique sources to crawl across all stages.")
+
+    cache_stats = Counter()
+    crawled: Dict[str, str] = {}
+    failed_urls = set()
+    pending_ids, pending_documents, pending_metadatas = [], [], []
+
+    def flush_pending():
+        if not pending_ids:
+            return
+        versions = {metadata['source_url']: metadata['content_hash'] for metadata in pending_metadatas}
         try:
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-            cleaned_text = trafilatura.extract(response.text)
-
-            if not cleaned_text or len(cleaned_text) < 250:
-                logger.warning("Initial crawl failed or content too short. Falling back to robust JS rendering.")
-                try:
-                    r = html_session.get(url)
-                    r.html.render(sleep=3, timeout=25)
-                    cleaned_text = trafilatura.extract(r.html.html)
-                except Exception as e:
-                    logger.error(f"Robust JS rendering failed for {url}: {e}")
-                    cleaned_text = None
+            vectors = embedding_service.embed_documents(pending_documents)
+            vector_store.upsert(ids=pending_ids, embeddings=vectors, documents=pending_documents, metadatas=pending_metadatas)
+            crawled.update((url, content_hash) for url, content_hash in versions.items() if url not in failed_urls)
+            cache_stats['chunks'] += len(pending_ids)
+            logger.info(f"Added {len(pending_ids)} chunks for {len(versions)} sources to the vector store.")
+        except Exception as e:
+            logger.error(f"Error embedding chunks for {list(versions)}: {e}")
+            # Their remaining chunks are dropped too. Chunks already stored stay without a last_chunk marker, so no run
+            # reuses them; they are not deleted because another job may be writing the same content version.
+            failed_urls.update(versions)
+            for url in versions:
+                crawled.pop(url, None)
+        pending_ids.clear()
+        pending_documents.clear()
+        pending_metadatas.clear()
+
+    for i, (source, cleaned_text) in enumerate(crawl_sources(unique_sources_to_crawl, cache_stats, prefetched)):
+        url = source['url']
+        logger.info(f"Processing crawled source {i+1}/{len(unique_sources_to_crawl)}: {url}")
+        if not cleaned_text:
+            logger.warning(f"Failed to extract content from {url} after robust attempt.")
+            continue
 
-            if cleaned_text:
-                discussed_techs = source.get('discussed_technologies', [])
-                if not discussed_techs:
-                    logger.warning(f"Skipping source {url} as no technologies were associated with it by the LLM.")
-                    continue
-                
-                docs = [Document(page_content=cleaned_text, metadata={"source_url": url, "technologies": ", ".join(discussed_techs)})]
-                chunks = text_splitter.split_documents(docs)
-                
-                ids = [f"{url}_{j}" for j in range(len(chunks))]
-                vector_store.add(ids=ids, documents=[chunk.page_content for chunk in chunks], metadatas=[chunk.metadata for chunk in chunks])
-                logger.info(f"Successfully added {len(chunks)} chunks for {url}.")
-            else:
-                logger.warning(f"Failed to extract content from {url} after robust attempt.")
+        discussed_techs = source.get('discussed_technologies', [])
+        if not discussed_techs:
+            logger.warning(f"Skipping source {url} as no technologies were associated with it by the LLM.")
+            continue
 
+        cache_stats['chars_extracted'] += len(cleaned_text)
+        content_hash = hashlib.sha256(cleaned_text.encode('utf-8')).hexdigest()
+        try:
+            stored = vector_store.get(where={"source_url": url}, include=["metadatas"])
+            if any(m.get("content_hash") == content_hash and m.get("last_chunk") for m in stored['metadatas']):
+                logger.info(f"Content unchanged for {url}. Reusing stored chunks.")
+                crawled[url] = content_hash
+                continue
+            now = time.time()
+            # Chunks without stored_at predate versioned ids and would duplicate the current version, so they always go.
+            stale_ids = [chunk_id for chunk_id, m in zip(stored['ids'], stored['metadatas']) if "stored_at" not in m
+                         or (m.get("content_hash") != content_hash and now - m["stored_at"] > STALE_CHUNK_GRACE_SECONDS)]
+            if stale_ids:
+                vector_store.delete(ids=stale_ids)
+                logger.info(f"Removed {len(stale_ids)} stale chunks of {url} from older versions or id formats.")
         except Exception as e:
-            logger.error(f"Error crawling {url}: {e}")
+            logger.error(f"Error checking stored chunks for {url}: {e}")
+            continue
 
-    state['vector_store'] = vector_store
+        # Chunk ids and the retrieval filter are versioned by content hash, so concurrent jobs never overwrite or
+        # delete each other's chunks; the last chunk carries a marker, written only after every earlier flush succeeded.
+        metadata = {"source_url": url, "technologies": ", ".join(discussed_techs), "content_hash": content_hash, "stored_at": time.time()}
+        chunk_count = 0
+        for chunk in iter_chunks(cleaned_text, text_splitter):
+            if len(pending_ids) >= embedding_service.batch_size:
+                flush_pending()
+                if url in failed_urls:
+                    break
+            pending_ids.append(f"{url}_{content_hash[:16]}_{chunk_count}")
+            pending_documents.append(chunk)
+            pending_metadatas.append(metadata)
+            chunk_count += 1
+        if url in failed_urls:
+            logger.warning(f"Dropped the remaining chunks of {url} after a failed flush.")
+            continue
+        if chunk_count:
+            pending_metadatas[-1] = {**metadata, "last_chunk": True}
+        logger.info(f"Chunked {url} into {chunk_count} chunks.")
+    flush_pending()
+
+    crawl_stats = {
+        "bytes_fetched": cache_stats['bytes_fetched'],
+        "chars_extracted": cache_stats['chars_extracted'],
+        "chunks_embedded": cache_stats['chunks'],
+        "peak_rss_mb": peak_rss_mb()
+    }
+    logger.info(f"Page cache: {cache_stats['hit']} hits, {cache_stats['revalidated']} revalidated, {cache_stats['miss']} misses, {cache_stats['rendered']} rendered.")
+    logger.info(f"Crawl processed {crawl_stats['bytes_fetched'] / 1e6:.1f} MB fetched, {crawl_stats['chars_extracted']} characters extracted, {crawl_stats['chunks_embedded']} chunks embedded. Peak RSS: {crawl_stats['peak_rss_mb'] or 'n/a'} MB.")
+    logger.info(f"{len(crawled)} sources available in the vector store for this run.")
+    state['crawled_urls'] = list(crawled)
+    state['crawled_content_hashes'] = crawled
+    state['crawl_stats'] = crawl_stats
     logger.info("---CRAWLING AND RAG STORE COMPLETE---")
     return state
 
+def search_rank_and_crawl(state: ResearchState) -> ResearchState:
+    """Streaming replacement for execute_web_search, rank_and_filter_sources and crawl_and_build_rag_store.
+
+    Search results are deduplicated in query order, so sources get the same ids as in the barrier nodes. Each batch
+    goes to the LLM as soon as it reaches the ranking token budget: while results arrive when the local pre-filter is
+    off, otherwise once every query has returned and the candidates are known, so no LLM calls are spent on sources
+    the pre-filter drops. Any URL entering a stage's running top 10 is fetched right away, and queued fetches for URLs
+    that fall out of every top 10 are cancelled. The final scoring and vector store update match the barrier nodes.
+    """
+    logger.info("⚡ ---NODE: STREAMING SEARCH, RANKING AND CRAWLING---")
+    search_queries = state['search_queries']
+    runtime_date = state['runtime_date']
+    technologies = state['technologies']
+    report_stages = state['report_stages']
+    research_stages = [stage for stage in report_stages if stage.lower() not in NON_RESEARCH_STAGES]
+    search_workers = int(os.getenv("BRAVE_MAX_CONCURRENCY", "4"))
+    top_k = int(os.getenv("RANKING_PREFILTER_TOP_K", "25"))
+    session, headers = open_search_session(search_workers)
+    tokenizer = get_tokenizer()
+    ranker = SourceRanker(technologies, research_stages)
+    deduplicator = SourceDeduplicator()
+
+    raw_sources: List[Dict] = []
+    evals_by_stage = {stage: {} for stage in research_stages}
+    scored_by_stage: Dict[str, List[Tuple[float, int]]] = {stage: [] for stage in research_stages}
+    candidates_by_stage: Optional[Dict[str, set]] = None
+    open_batches: List[Tuple[List[Dict], int]] = [([], 0) for _ in ranker.stage_groups]
+    prefetched: Dict[str, Future] = {}
+    pending: Dict[Future, Tuple[str, int]] = {}
+    finished_queries: Dict[int, Tuple[List[Dict], Optional[float], int]] = {}
+    latencies = []
+    stats = Counter()
+
+    def add_evaluations(evaluations: Dict[str, Dict[int, Dict]]) -> None:
+        """Records evaluations, keeping every stage's scored sources sorted as (-final score, id)."""
+        for stage, stage_evals in evaluations.items():
+            evals_by_stage[stage].update(stage_evals)
+            for source_id, llm_eval in stage_evals.items():
+                score = final_score(raw_sources[source_id], llm_eval, runtime_date) if source_id in range(len(raw_sources)) else None
+                if score is not None:
+                    scored_by_stage[stage].append((-score, source_id))
+            scored_by_stage[stage].sort()
+
+    def submit_batch(group: int) -> None:
+        batch, _ = open_batches[group]
+        open_batches[group] = ([], 0)
+        pending[submit_in_context(rank_executor, ranker.rank_batch, batch, ranker.stage_groups[group])] = ("rank", group)
+        stats['llm_calls'] += 1
+
+    def enqueue(source: Dict, group: int) -> None:
+        stage_group = ranker.stage_groups[group]
+        hits = ranker.cached(source, stage_group)
+        if hits is not None:
+            add_evaluations({stage: {source['id']: hit} for stage, hit in hits.items()})
+            stats['cached_evaluations'] += 1
+            return
+        token_count = ranker.token_count(source, stage_group)
+        if open_batches[group][0] and open_batches[group][1] + token_count > RANKING_TOKEN_LIMIT:
+            submit_batch(group)
+        batch, batch_tokens = open_batches[group]
+        open_batches[group] = (batch + [source], batch_tokens + token_count)
+
+    def add_source(result: Dict) -> None:
+        result['id'] = len(raw_sources)
+        result['token_count'] = len(tokenizer.encode(f"Title: {result.get('title', '')}\nSnippet: {result.get('description', '')}"))
+        raw_sources.append(result)
+        if top_k <= 0:
+            for group in range(len(ranker.stage_groups)):
+                enqueue(result, group)
+
+    def finish_search() -> None:
+        """Queues the pre-filter candidates, unless sources were streamed already, and sends every open batch to the LLM."""
+        nonlocal candidates_by_stage
+        log_search_metrics(latencies, stats['retries'], len(search_queries))
+        deduplicator.log_summary()
+        logger.info(f"Found {len(raw_sources)} unique sources across all queries.")
+        if 0 < top_k < len(raw_sources):
+            candidates_by_stage = prefilter_sources(raw_sources, research_stages, technologies, top_k)
+            logger.info(f"Local pre-filter kept the top {top_k} of {len(raw_sources)} sources per stage.")
+        for group, stage_group in enumerate(ranker.stage_groups):
+            if top_k > 0:
+                group_ids = set().union(*(candidates_by_stage[stage] for stage in stage_group)) if candidates_by_stage else None
+                for source in raw_sources:
+                    if group_ids is None or source['id'] in group_ids:
+                        enqueue(source, group)
+            if open_batches[group][0]:
+                submit_batch(group)
+
+    def update_prefetch() -> None:
+        wanted = set()
+        for stage, scored in scored_by_stage.items():
+            allowed = candidates_by_stage[stage] if candidates_by_stage else None
+            top_ids = [source_id for _, source_id in scored if allowed is None or source_id in allowed][:10]
+            wanted.update(raw_sources[source_id]['url'] for source_id in top_ids)
+        for url in wanted - prefetched.keys():
+            prefetched[url] = submit_in_context(crawl_executor, fetch_and_extract, url)
+            stats['prefetched'] += 1
+        for url in prefetched.keys() - wanted:
+            if prefetched[url].cancel():
+                del prefetched[url]
+                stats['cancelled'] += 1
+
+    with ThreadPoolExecutor(max_workers=search_workers) as search_executor, \
+            ThreadPoolExecutor(max_workers=int(os.getenv("RANKING_MAX_CONCURRENCY", "4"))) as rank_executor, \
+            ThreadPoolExecutor(max_workers=int(os.getenv("CRAWL_MAX_WORKERS", "8"))) as crawl_executor:
+        for index, query in enumerate(search_queries):
+            pending[submit_in_context(search_executor, run_search_query, session, headers, query)] = ("search", index)
+        next_query = 0
+        if not search_queries:
+            finish_search()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                if kind == "rank":
+                    add_evaluations(future.result())
+                    continue
+                finished_queries[key] = future.result()
+                while next_query in finished_queries:
+                    results, latency, retries = finished_queries.pop(next_query)
+                    next_query += 1
+                    stats['retries'] += retries
+                    if latency is not None:
+                        latencies.append(latency)
+                    for result in results:
+                        if deduplicator.add(result):
+                            add_source(result)
+                    if next_query == len(search_queries):
+                        finish_search()
+            update_prefetch()
+        logger.info(f"Ranking used {stats['llm_calls']} LLM calls for {len(research_stages)} stages; {stats['cached_evaluations']} source evaluations came from the relevance cache.")
+
+        ranked_sources_by_stage = {stage: [] for stage in report_stages}
+        for stage in research_stages:
+            ranked_sources_by_stage[stage] = score_sources(raw_sources, evals_by_stage[stage], runtime_date, candidates_by_stage[stage] if candidates_by_stage else None)
+            logger.info(f"Found {len(ranked_sources_by_stage[stage])} relevant sources for stage '{stage}'.")
+        final_urls = {source['url'] for sources in ranked_sources_by_stage.values() for source in sources}
+        dropped = [url for url in prefetched if url not in final_urls]
+        for url in dropped:
+            prefetched.pop(url).cancel()
+        logger.info(f"Started {stats['prefetched']} fetches while ranking; cancelled {stats['cancelled']} queued fetches and dropped {len(dropped)} sources outside the final top 10.")
+
+        state['raw_sources'] = raw_sources
+        state['ranked_sources'] = ranked_sources_by_stage
+        return crawl_and_build_rag_store(state, prefetched)
+
 def generate_report_iteratively(state: ResearchState) -> ResearchState:
     logger.info("✍️ ---NODE: GENERATING REPORT ITERATIVELY---")
     report_stages = state['report_stages']
@@ -498,50 +2249,109 @@ def generate_report_iteratively(state: ResearchState) -> ResearchState:
     logger.info(f"Original technologies requested: {technologies}")
     logger.info(f"Generating report for technologies found in sources: {final_technologies_to_discuss}")
 
-    collection_name = os.getenv("CHROMA_COLLECTION_NAME", "report")
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    chroma_vector_store = Chroma(client=state['chroma_client'], collection_name=collection_name, embedding_function=embeddings)
-    retriever = chroma_vector_store.as_retriever(search_kwargs={"k": 15})
+    embedding_service = get_embedding_service()
+    crawled_urls = state.get('crawled_urls') or []
+    try:
+        index = RetrievalIndex.from_collection(get_vector_store(), crawled_urls, ranked_sources, state.get('crawled_content_hashes'))
+    except Exception as e:
+        logger.error(f"Failed to build retrieval index, sections will be written without retrieved context: {e}")
+        index = RetrievalIndex([], [], [], [], {})
+    research_stages = [stage for stage in report_stages if stage.lower() not in NON_RESEARCH_STAGES]
+
+    def section_query(stage: str) -> str:
+        return f"Information about {stage} for {' vs '.join(final_technologies_to_discuss)}"
+
+    def retrieve(stages: List[str]) -> Dict[str, Tuple[List[float], List[int]]]:
+        queries = [section_query(stage) for stage in stages]
+        query_embeddings = embedding_service.embed_queries(queries) if queries else []
+        return {stage: (query_embedding, list(dict.fromkeys(rows + index.stage_rows.get(stage, []))))
+                for stage, query_embedding, rows in zip(stages, query_embeddings, index.search(query_embeddings, queries))}
+
+    try:
+        retrieved = retrieve(research_stages)
+    except Exception as e:
+        logger.error(f"Failed to embed section queries in one batch, retrying per section: {e}")
+        retrieved = {}
+    token_budget = int(os.getenv("SECTION_CONTEXT_TOKEN_BUDGET", "8000"))
+    best_source_scores = {}
+    for sources_in_stage in ranked_sources.values():
+        for source in sources_in_stage:
+            best_source_scores[source['url']] = max(best_source_scores.get(source['url'], 0.0), source['final_score'])
     
     pro_llm = get_llm("pro")
-    report_draft = ""
-
-    for stage in report_stages:
-        logger.info(f"Generating section: '{stage}'")
-        
-        context_docs = "No context needed for this section."
-        if stage.lower() not in ["introduction", "conclusion", "final assessment"]:
-            query = f"Information about {stage} for {' vs '.join(final_technologies_to_discuss)}"
-            retrieved_docs = retriever.invoke(query)
-            
-            top_urls_for_stage = {s['url'] for s in ranked_sources.get(stage, [])}
-            if top_urls_for_stage:
-                top_docs = chroma_vector_store.get(where={"source_url": {"$in": list(top_urls_for_stage)}})
-                
-                all_docs_for_stage = retrieved_docs
-                for i, doc_id in enumerate(top_docs['ids']):
-                    if doc_id not in [d.metadata.get('id', '') for d in all_docs_for_stage]:
-                         all_docs_for_stage.append(Document(page_content=top_docs['documents'][i], metadata=top_docs['metadatas'][i]))
-            else:
-                all_docs_for_stage = retrieved_docs
+    runtime_date = state['runtime_date']
+    append_partial_report(technologies, runtime_date, report_header(technologies, runtime_date), start=True)
+    streaming = _token_sink.get() is not None
+    refresh = os.getenv("REPORT_REFRESH", "false").lower() == "true"
+    previous_sections = (load_manifest(technologies) or {}).get("sections", {}) if refresh else {}
+    sections: Dict[str, Dict] = {}
+    finished_sections: Dict[int, str] = {}
+
+    def write_partial(position: int, section: str) -> None:
+        """Rewrites the partial report with every finished section in stage order, whatever order they finish in."""
+        finished_sections[position] = section
+        write_partial_report(technologies, runtime_date, report_header(technologies, runtime_date) + "".join(
+            finished_sections[i] for i in sorted(finished_sections)))
+
+    def build_context(stage: str) -> Tuple[str, List[Dict]]:
+        if stage.lower() in NON_RESEARCH_STAGES:
+            return "No context needed for this section.", []
+        query_embedding, rows = retrieved[stage] if stage in retrieved else retrieve([stage])[stage]
+        candidates = [index.chunk(row) for row in rows]
+        source_scores = {**best_source_scores, **{s['url']: s['final_score'] for s in ranked_sources.get(stage, [])}}
+        selected = assemble_context(query_embedding, candidates, source_scores, token_budget)
+        logger.info(f"Selected {len(selected)} of {len(candidates)} candidate chunks for section '{stage}'.")
+        return format_context(selected), selected
+
+    async def generate_section(position: int, stage: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            logger.info(f"Generating section: '{stage}'")
+            try:
+                context_docs, selected = await asyncio.to_thread(build_context, stage)
+                prompt = PROMPT_WRITE_SECTION.format(
+                    stage_name=stage,
+                    technologies=", ".join(final_technologies_to_discuss),
+                    context_documents=context_docs
+                )
+                evidence = {
+                    "sources": [s['url'] for s in ranked_sources.get(stage, [])],
+                    "chunks": sorted(hashlib.sha256(chunk['document'].encode('utf-8')).hexdigest()[:16] for chunk in selected),
+                    "prompt_hash": prompt_hash(pro_llm.model_name, prompt)
+                }
+                previous = previous_sections.get(stage)
+                if previous and previous.get('prompt_hash') == evidence['prompt_hash']:
+                    logger.info(f"Evidence unchanged for section '{stage}'. Reusing it from the previous report.")
+                    section_content = previous['content']
+                    emit_tokens(stage, section_content)
+                else:
+                    if previous:
+                        logger.info(f"Evidence changed for section '{stage}' ({describe_evidence_change(previous, evidence)}). Regenerating it.")
+                    if streaming:
+                        section_content = (await pro_llm.astream(prompt, lambda text: emit_tokens(stage, text))).content
+                    else:
+                        section_content = (await pro_llm.ainvoke(prompt)).content
+                    evidence['regenerated'] = True
+                sections[stage] = {**evidence, "content": section_content}
+                logger.info(f"Finished section: '{stage}'")
+                section = f"## {stage}\n\n{section_content}\n\n"
+            except Exception as e:
+                logger.error(f"Error generating section '{stage}': {e}")
+                section = f"## {stage}\n\n_Error: Could not generate this section due to an unexpected error._\n\n"
+            emit_tokens(stage, "", done=True)
+            write_partial(position, section)
+            return section
 
-            unique_docs = {f"{doc.metadata.get('source_url')}_{doc.page_content}": doc for doc in all_docs_for_stage}
-            context_docs = "\n\n---\n\n".join([f"Source: {doc.metadata['source_url']}\nContent: {doc.page_content}" for doc in unique_docs.values()])
+    async def generate_all_sections() -> List[str]:
+        semaphore = asyncio.Semaphore(int(os.getenv("REPORT_SECTION_CONCURRENCY", "4")))
+        return await asyncio.gather(*(generate_section(position, stage, semaphore) for position, stage in enumerate(report_stages)))
 
-        prompt = PROMPT_WRITE_SECTION.format(
-            stage_name=stage,
-            technologies=", ".join(final_technologies_to_discuss),
-            context_documents=context_docs
-        )
-        
-        try:
-            section_content = pro_llm.invoke(prompt).content
-            report_draft += f"## {stage}\n\n{section_content}\n\n"
-        except Exception as e:
-            logger.error(f"Error generating section '{stage}': {e}")
-            report_draft += f"## {stage}\n\n_Error: Could not generate this section due to an unexpected error._\n\n"
+    report_draft = "".join(run_async(generate_all_sections()))
+    if refresh:
+        regenerated = [stage for stage, section in sections.items() if section.get('regenerated')]
+        logger.info(f"Refresh regenerated {len(regenerated)} of {len(report_stages)} sections: {regenerated}")
 
     state['report_draft'] = report_draft
+    state['report_manifest'] = {"sections": {stage: {k: v for k, v in section.items() if k != 'regenerated'} for stage, section in sections.items()}}
     logger.info("---REPORT DRAFT COMPLETE---")
     return state
 
@@ -550,7 +2360,20 @@ def final_review(state: ResearchState) -> ResearchState:
     logger.info("🧐 ---NODE: PERFORMING FINAL REVIEW---")
     llm = get_llm("pro")
     prompt = PROMPT_FINAL_REVIEW.format(report_draft=state['report_draft'])
-    response = llm.invoke(prompt).content
+    review_hash = prompt_hash(llm.model_name, prompt)
+    previous = load_manifest(state['technologies']) if os.getenv("REPORT_REFRESH", "false").lower() == "true" else None
+    if state.get('report_manifest') is not None:
+        state['report_manifest']['review_hash'] = review_hash
+    if previous and previous.get('review_hash') == review_hash and previous.get('reviewer_notes'):
+        logger.info("Report draft unchanged since the previous report. Reusing its final review.")
+        response = previous['reviewer_notes']
+        emit_tokens("Final Assessment", response, done=True)
+    elif _token_sink.get() is not None:
+        response = llm.stream(prompt, lambda text: emit_tokens("Final Assessment", text)).content
+        emit_tokens("Final Assessment", "", done=True)
+    else:
+        response = llm.invoke(prompt).content
+    append_partial_report(state['technologies'], state['runtime_date'], f"## Final Assessment\n\n{response}\n")
     state['reviewer_notes'] = response
     logger.info("Final review complete. Notes generated.")
     return state
@@ -562,16 +2385,30 @@ def compile_final_report(state: ResearchState) -> ResearchState:
     report_draft = state['report_draft']
     reviewer_notes = state['reviewer_notes']
 
-    final_report = f"# Technology Analysis Report: {', '.join(technologies)}\n\n"
-    final_report += f"*Report generated on: {runtime_date.strftime('%Y-%m-%d %H:%M:%S')}*\n\n"
+    final_report = report_header(technologies, runtime_date)
     final_report += report_draft
     
     if reviewer_notes:
         final_report += f"## Final Assessment\n\n{reviewer_notes}\n"
 
-    file_name = f"report_{'_vs_'.join(t.lower().replace(' ', '_') for t in technologies)}_{runtime_date.strftime('%Y-%m-%d')}.md"
-    with open(file_name, "w", encoding='utf-8') as f:
+    file_name = report_file_name(technologies, runtime_date)
+    with open(f"{file_name}.tmp", "w", encoding='utf-8') as f:
         f.write(final_report)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{file_name}.tmp", file_name)
+    if os.path.exists(f"{file_name}.partial"):
+        os.remove(f"{file_name}.partial")
+
+    if state.get('report_manifest') is not None:
+        save_manifest(technologies, {
+            "technologies": technologies,
+            "report_file": file_name,
+            "generated_at": runtime_date.isoformat(),
+            **state['report_manifest'],
+            "reviewer_notes": reviewer_notes
+        })
+        logger.info(f"Saved report manifest to {manifest_file_name(technologies)}.")
 
     state['final_report'] = final_report
     logger.info(f"Report generation complete. File saved to: {file_name}")
@@ -584,34 +2421,107 @@ def should_continue(state: ResearchState) -> str:
     else:
         return "generate_search_queries"
 
-workflow = StateGraph(ResearchState)
-
-workflow.add_node("define_report_stages", define_report_stages)
-workflow.add_node("generate_search_queries", generate_search_queries)
-workflow.add_node("execute_web_search", execute_web_search)
-workflow.add_node("rank_and_filter_sources", rank_and_filter_sources)
-workflow.add_node("crawl_and_build_rag_store", crawl_and_build_rag_store)
-workflow.add_node("generate_report_iteratively", generate_report_iteratively)
-workflow.add_node("final_review", final_review)
-workflow.add_node("compile_final_report", compile_final_report)
-
-workflow.set_entry_point("define_report_stages")
+def build_workflow():
+    """Builds the research graph. langgraph is imported here so that importing main stays cheap."""
+    from langgraph.graph import END, StateGraph
 
-workflow.add_conditional_edges(
-    "define_report_stages",
-    should_continue,
-    {"generate_search_queries": "generate_search_queries", "end": END}
-)
+    workflow = StateGraph(ResearchState)
 
-workflow.add_edge("generate_search_queries", "execute_web_search")
-workflow.add_edge("execute_web_search", "rank_and_filter_sources")
-workflow.add_edge("rank_and_filter_sources", "crawl_and_build_rag_store")
-workflow.add_edge("crawl_and_build_rag_store", "generate_report_iteratively")
-workflow.add_edge("generate_report_iteratively", "final_review")
-workflow.add_edge("final_review", "compile_final_report")
-workflow.add_edge("compile_final_report", END)
+    workflow.add_node("define_report_stages", instrument_node("define_report_stages", define_report_stages))
+    workflow.add_node("generate_search_queries", instrument_node("generate_search_queries", generate_search_queries))
+    streaming = os.getenv("PIPELINE_MODE", "barrier") == "streaming"
+    if streaming:
+        workflow.add_node("search_rank_and_crawl", instrument_node("search_rank_and_crawl", search_rank_and_crawl))
+    else:
+        workflow.add_node("execute_web_search", instrument_node("execute_web_search", execute_web_search))
+        workflow.add_node("rank_and_filter_sources", instrument_node("rank_and_filter_sources", rank_and_filter_sources))
+        workflow.add_node("crawl_and_build_rag_store", instrument_node("crawl_and_build_rag_store", crawl_and_build_rag_store))
+    workflow.add_node("generate_report_iteratively", instrument_node("generate_report_iteratively", generate_report_iteratively))
+    workflow.add_node("final_review", instrument_node("final_review", final_review))
+    workflow.add_node("compile_final_report", instrument_node("compile_final_report", compile_final_report))
+
+    workflow.set_entry_point("define_report_stages")
+
+    workflow.add_conditional_edges(
+        "define_report_stages",
+        should_continue,
+        {"generate_search_queries": "generate_search_queries", "end": END}
+    )
 
-app = workflow.compile()
+    if streaming:
+        workflow.add_edge("generate_search_queries", "search_rank_and_crawl")
+        workflow.add_edge("search_rank_and_crawl", "generate_report_iteratively")
+    else:
+        workflow.add_edge("generate_search_queries", "execute_web_search")
+        workflow.add_edge("execute_web_search", "rank_and_filter_sources")
+        workflow.add_edge("rank_and_filter_sources", "crawl_and_build_rag_store")
+        workflow.add_edge("crawl_and_build_rag_store", "generate_report_iteratively")
+    workflow.add_edge("generate_report_iteratively", "final_review")
+    workflow.add_edge("final_review", "compile_final_report")
+    workflow.add_edge("compile_final_report", END)
+    return workflow
+
+@lru_cache(maxsize=None)
+def get_app():
+    """Compiles the graph without a checkpointer on first use."""
+    return build_workflow().compile()
+
+def get_checkpointer() -> "SqliteSaver":
+    from langgraph.checkpoint.sqlite import SqliteSaver
+    checkpoint_path = os.getenv("CHECKPOINT_DB_PATH", "./checkpoints.sqlite")
+    logger.info(f"Persisting node checkpoints to {checkpoint_path}.")
+    return SqliteSaver(sqlite3.connect(checkpoint_path, check_same_thread=False))
+
+def load_jobs(path: str) -> List[List[str]]:
+    """Reads technology sets from a JSONL file (one list or {"technologies": [...]} per line) or a YAML list."""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("PyYAML is required for YAML job files: pip install pyyaml")
+            entries = yaml.safe_load(f) or []
+        else:
+            entries = [json.loads(line) for line in f if line.strip()]
+    return [entry["technologies"] if isinstance(entry, dict) else entry for entry in entries]
+
+def run_batch(graph, jobs: List[List[str]], workers: int) -> None:
+    """Runs many reports concurrently in one process, sharing caches, clients and rate limiters."""
+    def run_job(technologies: List[str]) -> Tuple[str, bool]:
+        """Returns the run id and whether the run wrote a report (runs that end as not comparable do not)."""
+        run_id = uuid.uuid4().hex[:12]
+        profile = RunProfile(run_id)
+        _current_profile.set(profile)
+        logger.info(f"---STARTING BATCH JOB {run_id} for: {technologies}---")
+        try:
+            final_state = graph.invoke({"technologies": technologies}, {"configurable": {"thread_id": run_id}})
+        finally:
+            profile.save()
+        return run_id, bool(final_state.get('final_report'))
+
+    logger.info(f"---STARTING BATCH of {len(jobs)} jobs with {workers} workers---")
+    started = time.perf_counter()
+    completed = skipped = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {submit_in_context(executor, run_job, technologies): technologies for technologies in jobs}
+        for future in as_completed(futures):
+            try:
+                run_id, reported = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"Batch job for {futures[future]} failed: {e}")
+                continue
+            if reported:
+                completed += 1
+                logger.info(f"Batch job {run_id} for {futures[future]} complete ({completed + skipped + failed}/{len(jobs)}).")
+            else:
+                skipped += 1
+                logger.warning(f"Batch job {run_id} for {futures[future]} ended without a report ({completed + skipped + failed}/{len(jobs)}).")
+    elapsed = time.perf_counter() - started
+    summary = (f"Batch complete: {completed} reports, {skipped} without a report, {failed} failed in {elapsed:.1f}s "
+               f"({completed / elapsed * 3600:.1f} reports/hour).")
+    logger.info(summary)
+    print(summary)
 
 # --- Main Execution ---
 if __name__ == '__main__':
@@ -620,14 +2530,51 @@ if __name__ == '__main__':
     os.environ.setdefault("GEMINI_PRO_MODEL", "gemini-2.5-flash")
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("technologies", nargs='+', help="List of technologies to research.")
+    parser.add_argument("technologies", nargs='*', help="List of technologies to research.")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume a previous run from its last completed node.")
+    parser.add_argument("--batch", metavar="JOB_FILE", help="Run every technology set in a JSONL or YAML job file.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of batch jobs run concurrently.")
+    parser.add_argument("--profile", action="store_true", help="Print a per-node timing, token and cache summary at the end of the run.")
+    parser.add_argument("--stream", action="store_true", help="Print report sections and the final assessment to stdout as they are generated.")
+    parser.add_argument("--refresh", action="store_true", help="Reuse sections of the previous report whose evidence is unchanged (same as REPORT_REFRESH=true).")
     args = parser.parse_args()
-
-    logger.info(f"---STARTING RESEARCH PROCESS for: {args.technologies}---")
-    initial_state = {"technologies": args.technologies}
-
-    for event in app.stream(initial_state):
-        for key, value in event.items():
-            logger.info(f"➡️ ---GRAPH EVENT: {key.upper()}---")
-
-    logger.info("---RESEARCH PROCESS COMPLETE---")
\ No newline at end of file
+    if not args.technologies and not args.resume and not args.batch:
+        parser.error("provide technologies to research, --resume RUN_ID or --batch JOB_FILE")
+    configure_logging()
+    if args.refresh:
+        os.environ["REPORT_REFRESH"] = "true"
+
+    checkpointed_app = build_workflow().compile(checkpointer=get_checkpointer())
+    if args.batch:
+        run_batch(checkpointed_app, load_jobs(args.batch), args.workers)
+        log_llm_metrics()
+        sys.exit(0)
+
+    run_id = args.resume or uuid.uuid4().hex[:12]
+    config = {"configurable": {"thread_id": run_id}}
+    if args.resume:
+        snapshot = checkpointed_app.get_state(config)
+        if not snapshot.values:
+            parser.error(f"no checkpoints found for run {run_id}")
+        logger.info(f"---RESUMING RUN {run_id} for: {snapshot.values['technologies']} at {list(snapshot.next) or 'end'}---")
+        initial_state = None
+    else:
+        logger.info(f"---STARTING RESEARCH PROCESS {run_id} for: {args.technologies}---")
+        logger.info(f"Resume this run after a failure with: python main.py --resume {run_id}")
+        initial_state = {"technologies": args.technologies}
+
+    profile = RunProfile(run_id)
+    _current_profile.set(profile)
+    if args.stream:
+        _token_sink.set(StreamPrinter())
+    try:
+        for event in checkpointed_app.stream(initial_state, config):
+            for key, value in event.items():
+                logger.info(f"➡️ ---GRAPH EVENT: {key.upper()}---")
+    finally:
+        profile.save()
+        if args.profile:
+            print(profile.summary_table())
+
+    log_llm_metrics()
+    logger.info("---RESEARCH PROCESS COMPLETE---")